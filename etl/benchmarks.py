@@ -0,0 +1,165 @@
+import datetime
+import math
+import time
+
+import numpy as np
+
+from etl.evaluate import SMOOTHNESS_WEIGHT, bin_trades, minimize_errors, minimize_joint_errors
+from etl.records import Trade, dedupe_trades, load_trades
+from etl.trade_arrays import encode_trades, find_weighted_error, minimize_weighted_errors
+
+# minimize_errors takes finite difference gradients, so it is only benchmarked on the first trades of each period
+FINITE_DIFFERENCE_TRADE_LIMIT = 40
+# number of sweeps over the periods made by get_card_values, and its pause in seconds after each period and sweep
+SWEEP_COUNT = 33
+SWEEP_SLEEP_DURATION = 60
+
+
+# returns the trades of trades.json binned by the quarter they took place in, in order
+def get_trades_by_period() -> dict[datetime.date, list[Trade]]:
+    return bin_trades(load_trades("trades.json"))
+
+
+# compares iterations to converge and wall time of the plain and scaled parameterizations for every period
+def benchmark_scaling(finite_difference_trade_limit: int = FINITE_DIFFERENCE_TRADE_LIMIT):
+    print("analytic gradient solver, all trades of each period, cold started")
+    print(f"{'period':<12}{'trades':>8}{'plain its':>11}{'plain s':>9}{'plain err':>12}"
+          f"{'scaled its':>12}{'scaled s':>10}{'scaled err':>12}")
+    totals = [0.0, 0.0]
+    for period, trades in get_trades_by_period().items():
+        trades, weights = dedupe_trades(trades)
+        weights = np.array(weights, dtype=float)
+        arrays, card_ids, props = encode_trades(trades)
+        start_values = np.ones(len(card_ids) + 2 * len(props))
+        row = f"{str(period):<12}{int(weights.sum()):>8}"
+        for i, scaled in enumerate((False, True)):
+            start = time.perf_counter()
+            results = minimize_weighted_errors(arrays, weights, start_values, len(card_ids), len(props), scaled)
+            duration = time.perf_counter() - start
+            totals[i] += duration
+            row += f"{results.nit:>{12 if scaled else 11}}{duration:>{10 if scaled else 9}.2f}{results.fun:>12.4g}"
+        print(row)
+    print(f"total wall time: plain {totals[0]:.1f}s, scaled {totals[1]:.1f}s")
+
+    print(f"\nminimize_errors, first {finite_difference_trade_limit} trades of each period, cold started")
+    totals = [0.0, 0.0]
+    for period, trades in get_trades_by_period().items():
+        for i, scaled in enumerate((False, True)):
+            start = time.perf_counter()
+            minimize_errors(trades[:finite_difference_trade_limit], {}, {}, {}, scaled)
+            duration = time.perf_counter() - start
+            totals[i] += duration
+            print(f"{period} {'scaled' if scaled else 'plain'}: {duration:.2f}s")
+    print(f"total wall time: plain {totals[0]:.1f}s, scaled {totals[1]:.1f}s")
+
+
+# solves the trades of one period with the analytic gradient solver warm started from the previous estimates, as
+# get_card_values does with minimize_errors, and stores the solution as the previous estimates
+def solve_period(
+        trades: list[Trade],
+        previous: tuple[dict[int, float], dict[int, float], dict[int, float]]
+) -> tuple[dict[int, float], dict[int, float], dict[int, float]]:
+    trades, weights = dedupe_trades(trades)
+    arrays, card_ids, props = encode_trades(trades)
+    start_values = np.array([previous[0].get(k, 1) for k in card_ids] + [previous[1].get(k, 1) for k in props] +
+                            [previous[2].get(k, 1) for k in props], dtype=float)
+    x = minimize_weighted_errors(arrays, np.array(weights, dtype=float), start_values, len(card_ids), len(props),
+                                 True).x.tolist()
+    estimates = (
+        dict(zip(card_ids, x[:len(card_ids)])),
+        dict(zip(props, x[len(card_ids):len(card_ids) + len(props)])),
+        dict(zip(props, x[len(card_ids) + len(props):])),
+    )
+    for previous_block, block in zip(previous, estimates):
+        previous_block.update(block)
+    return estimates
+
+
+# runs the sweeps of get_card_values over the three offset binnings with the analytic gradient solver and without its
+# pauses, returning the estimates of every period merged over the last three sweeps as get_card_values does
+def run_sweeps(
+        trades: list[Trade],
+        sweep_count: int
+) -> dict[datetime.date, tuple[dict[int, float], dict[int, float], dict[int, float]]]:
+    trades_by_period_bins = [bin_trades(trades, offset) for offset in (0, 1, 2)]
+    previous = ({}, {}, {})
+    master = {}
+    for iteration in range(1, sweep_count + 1):
+        trade_bin = trades_by_period_bins[iteration % 3]
+        for period, period_trades in (trade_bin.items() if iteration % 2 else reversed(trade_bin.items())):
+            estimates = solve_period(period_trades, previous)
+            if iteration > sweep_count - 3:
+                if period not in master:
+                    master[period] = ({}, {}, {})
+                for master_block, block in zip(master[period], estimates):
+                    master_block.update(block)
+    return {k: master[k] for k in sorted(master.keys())}
+
+
+# returns the weighted sum of the square errors of the trades under the estimates, estimates which are missing count
+# as 1 like the start values of minimize_errors
+def get_period_error(
+        trades: list[Trade],
+        estimates: tuple[dict[int, float], dict[int, float], dict[int, float]]
+) -> float:
+    trades, weights = dedupe_trades(trades)
+    arrays, card_ids, props = encode_trades(trades)
+    values = np.array([estimates[0].get(k, 1) for k in card_ids] + [estimates[1].get(k, 1) for k in props] +
+                      [estimates[2].get(k, 1) for k in props], dtype=float)
+    return find_weighted_error(values, arrays, np.array(weights, dtype=float), len(card_ids), len(props))[0]
+
+
+# returns the mean absolute log ratio of each card's value to its value in the previous period it was estimated in
+def get_volatility(estimates: dict[datetime.date, tuple[dict[int, float], dict[int, float], dict[int, float]]]) -> float:
+    previous_values = {}
+    changes = []
+    for card_values, _, _ in estimates.values():
+        for card, value in card_values.items():
+            if card in previous_values:
+                changes.append(abs(math.log(value / previous_values[card])))
+            previous_values[card] = value
+    return sum(changes) / max(len(changes), 1)
+
+
+# counts the estimates below the bounds of minimize_errors, cards at 1 and prop values and mults at 0
+def get_bound_violations(
+        estimates: dict[datetime.date, tuple[dict[int, float], dict[int, float], dict[int, float]]]
+) -> int:
+    return sum(sum(value < 1 for value in card_values.values()) + sum(value < 0 for value in prop_values.values())
+               + sum(mult < 0 for mult in prop_mults.values())
+               for card_values, prop_values, prop_mults in estimates.values())
+
+
+# compares the wall time and output of the sweeps of get_card_values with the joint solve of minimize_joint_errors
+def benchmark_joint(sweep_count: int = SWEEP_COUNT, smoothness_weight: float = SMOOTHNESS_WEIGHT):
+    trades = load_trades("trades.json")
+    trades_by_period = bin_trades(trades)
+    pause = sweep_count * ((len(trades_by_period) + 3) * SWEEP_SLEEP_DURATION)
+    print(f"get_card_values pauses for {pause / 3600:.1f} hours over {sweep_count} sweeps of "
+          f"{len(trades_by_period)} periods, which is left out below")
+
+    start = time.perf_counter()
+    swept = run_sweeps(trades, sweep_count)
+    sweep_duration = time.perf_counter() - start
+    start = time.perf_counter()
+    joint = minimize_joint_errors(trades_by_period, smoothness_weight)
+    joint_duration = time.perf_counter() - start
+    print(f"wall time: {sweep_count} sweeps {sweep_duration:.1f}s, joint solve {joint_duration:.1f}s")
+
+    print(f"{'period':<12}{'trades':>8}{'sweep err':>12}{'joint err':>12}{'median card diff':>18}")
+    for period, period_trades in trades_by_period.items():
+        differences = sorted(abs(value / swept[period][0][card] - 1) for card, value in joint[period][0].items()
+                             if card in swept[period][0])
+        median = differences[len(differences) // 2] if differences else float("nan")
+        print(f"{str(period):<12}{len(period_trades):>8}{get_period_error(period_trades, swept[period]):>12.4g}"
+              f"{get_period_error(period_trades, joint[period]):>12.4g}{median:>18.2%}")
+    print(f"mean absolute log change of card values between periods: sweeps {get_volatility(swept):.3f}, "
+          f"joint {get_volatility(joint):.3f}")
+    print(f"estimates below their lower bounds: sweeps {get_bound_violations(swept)}, "
+          f"joint {get_bound_violations(joint)}")
+
+
+# run from the directory holding trades.json with `python -m etl.benchmarks`
+if __name__ == '__main__':
+    benchmark_scaling()
+    benchmark_joint()
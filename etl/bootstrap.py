@@ -0,0 +1,184 @@
+import datetime
+import math
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable
+
+import numpy as np
+
+from etl.evaluate import write_json
+from etl.records import Trade, dedupe_trades, load_trades
+from etl.trade_arrays import (
+    ARRAY_KEYS,
+    MINT_CARD_KEY,
+    MINT_TRADE_KEY,
+    PROP_INDEX_KEY,
+    PROP_MINT_KEY,
+    encode_trades,
+    minimize_weighted_errors,
+)
+from etl.valuation import PROP_INDEX_TO_NAME, get_period
+
+REPLICATE_COUNT = 200
+PERCENTILES = (5, 50, 95)
+PERCENTILE_KEYS = ("p5", "p50", "p95")
+# how many replicates drew a trade involving the estimate, the percentiles are taken over those replicates only
+REPLICATE_COUNT_KEY = "replicates"
+# how many of a period's trades each deduplicated trade stands for, shared alongside the trade arrays
+TRADE_WEIGHT_KEY = "trade_weight"
+
+# the trade arrays of every period, attached once per worker process by attach_shared_arrays
+shared_arrays: dict[str, np.ndarray] = {}
+shared_blocks: list[shared_memory.SharedMemory] = []
+
+
+# copies each array into a new shared memory block, returns the blocks and the specs needed to attach to them
+def share_arrays(arrays: dict[str, np.ndarray]) -> tuple[list[shared_memory.SharedMemory], dict[str, tuple]]:
+    blocks = []
+    specs = {}
+    for key, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        specs[key] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+# worker initializer, maps the shared trade arrays into this process without copying them
+def attach_shared_arrays(specs: dict[str, tuple]):
+    for key, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        shared_blocks.append(block)
+        shared_arrays[key] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+
+
+# resamples the trades of a period with replacement and returns the estimates which minimize their errors, along with
+# whether any resampled trade involves each estimate, estimates no drawn trade involves are left at their start values
+# layout holds the period's (mint start, mint end, prop start, prop end, trade start, trade end, card count, prop count)
+def solve_replicate(
+        layout: tuple[int, ...],
+        seed: tuple[int, ...],
+        start_values: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    mint_start, mint_end, prop_start, prop_end, trade_start, trade_end, card_count, prop_count = layout
+    arrays = {
+        key: shared_arrays[key][prop_start:prop_end] if key in (PROP_INDEX_KEY, PROP_MINT_KEY)
+        else shared_arrays[key][mint_start:mint_end]
+        for key in ARRAY_KEYS
+    }
+    # resampling n trades with replacement is equivalent to weighting each trade by its multinomial draw count,
+    # a deduplicated trade standing for k trades is drawn with k times the probability
+    counts = shared_arrays[TRADE_WEIGHT_KEY][trade_start:trade_end]
+    trade_count = counts.sum()
+    rng = np.random.default_rng(seed)
+    weights = rng.multinomial(int(trade_count), counts / trade_count).astype(np.float64)
+    mint_weights = weights[arrays[MINT_TRADE_KEY]]
+    card_weights = np.bincount(arrays[MINT_CARD_KEY], mint_weights, card_count)
+    prop_weights = np.bincount(arrays[PROP_INDEX_KEY], mint_weights[arrays[PROP_MINT_KEY]], prop_count)
+    identified = np.concatenate((card_weights, prop_weights, prop_weights)) > 0
+    return minimize_weighted_errors(arrays, weights, start_values, card_count, prop_count, True).x, identified
+
+
+# formats the percentiles of one estimate with how many replicates they were taken over, nan percentiles become None
+def get_band(percentiles: np.ndarray, replicate_count: int, publish: Callable[[float], float]) -> dict[str, Any]:
+    band: dict[str, Any] = {
+        key: None if math.isnan(value) else publish(value) for key, value in zip(PERCENTILE_KEYS, percentiles.tolist())
+    }
+    band[REPLICATE_COUNT_KEY] = replicate_count
+    return band
+
+
+# computes bootstrap percentile bands of card and property values for every period and writes them to data files
+def get_bootstrap_values(replicate_count: int = REPLICATE_COUNT, worker_count: int | None = None, seed: int = 0):
+    trades_by_period: dict[datetime.date, list[Trade]] = {}
+    for trade in load_trades("trades.json"):
+        period = get_period(datetime.date.fromordinal(trade.date))
+        if period not in trades_by_period:
+            trades_by_period[period] = []
+        trades_by_period[period].append(trade)
+    periods = sorted(trades_by_period.keys())
+
+    # every period's arrays are concatenated into one set of shared blocks, layouts locate each period within them
+    encoded = []
+    trade_weights = []
+    for period in periods:
+        trades, weights = dedupe_trades(trades_by_period[period])
+        print(f"deduplicated {len(trades_by_period[period])} trades into {len(trades)} weighted trades in {period}")
+        encoded.append(encode_trades(trades))
+        trade_weights.append(np.array(weights, dtype=np.float64))
+    layouts = []
+    mint_start = 0
+    prop_start = 0
+    trade_start = 0
+    for (arrays, card_ids, props), weights in zip(encoded, trade_weights):
+        mint_end = mint_start + len(arrays[MINT_CARD_KEY])
+        prop_end = prop_start + len(arrays[PROP_INDEX_KEY])
+        trade_end = trade_start + len(weights)
+        layouts.append((mint_start, mint_end, prop_start, prop_end, trade_start, trade_end, len(card_ids), len(props)))
+        mint_start = mint_end
+        prop_start = prop_end
+        trade_start = trade_end
+    all_arrays = {key: np.concatenate([arrays[key] for arrays, _, _ in encoded]) for key in ARRAY_KEYS}
+    all_arrays[TRADE_WEIGHT_KEY] = np.concatenate(trade_weights)
+    blocks, specs = share_arrays(all_arrays)
+
+    try:
+        # point estimates are solved in order, each warm started from the previous period like get_card_values
+        previous: dict[tuple[str, int], float] = {}
+        point_estimates = []
+        for period, (arrays, card_ids, props), weights in zip(periods, encoded, trade_weights):
+            keys = [("card", k) for k in card_ids] + [("prop", k) for k in props] + [("mult", k) for k in props]
+            start_values = np.array([previous.get(key, 1) for key in keys], dtype=float)
+            point = minimize_weighted_errors(arrays, weights, start_values, len(card_ids), len(props), True).x
+            previous.update(zip(keys, point))
+            point_estimates.append(point)
+            print(f"solved point estimate of {int(weights.sum())} trades in period {period}")
+
+        tasks = [
+            (layout, (seed, i, replicate), point)
+            for i, (layout, point) in enumerate(zip(layouts, point_estimates))
+            for replicate in range(replicate_count)
+        ]
+        worker_count = worker_count or os.cpu_count()
+        with ProcessPoolExecutor(worker_count, initializer=attach_shared_arrays, initargs=(specs,)) as executor:
+            print(f"solving {len(tasks)} replicates with {worker_count} workers")
+            replicates = list(executor.map(solve_replicate, *zip(*tasks), chunksize=max(1, replicate_count // 8)))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    all_card_values = {}
+    all_prop_values = {}
+    all_prop_mults = {}
+    for i, (period, (_, card_ids, props)) in enumerate(zip(periods, encoded)):
+        values, identified = zip(*replicates[i * replicate_count:(i + 1) * replicate_count])
+        identified = np.array(identified)
+        # a replicate which drew none of an estimate's trades says nothing about it, the band of an estimate no
+        # replicate identified is all nan and written as null
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            bands = np.nanpercentile(np.where(identified, np.array(values), np.nan), PERCENTILES, axis=0)
+        replicate_counts = identified.sum(axis=0).tolist()
+        card_count = len(card_ids)
+        prop_count = len(props)
+        for j, card in enumerate(card_ids):
+            all_card_values.setdefault(card, {})[str(period)] = get_band(
+                bands[:, j], replicate_counts[j], lambda value: math.floor(value * 10000))
+        for j, prop in enumerate(props):
+            all_prop_values.setdefault(PROP_INDEX_TO_NAME[prop], {})[str(period)] = get_band(
+                bands[:, card_count + j], replicate_counts[card_count + j], lambda value: math.floor(value * 10000))
+            all_prop_mults.setdefault(PROP_INDEX_TO_NAME[prop], {})[str(period)] = get_band(
+                bands[:, card_count + prop_count + j], replicate_counts[card_count + prop_count + j],
+                lambda mult: round(mult, 5))
+
+    write_json(all_card_values, "values/bootstrap_card_values")
+    write_json(all_prop_values, "values/bootstrap_prop_values")
+    write_json(all_prop_mults, "values/bootstrap_prop_mults")
+
+
+# run from the repository root with `python -m etl.bootstrap`
+if __name__ == '__main__':
+    get_bootstrap_values()
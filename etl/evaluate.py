@@ -4,109 +4,17 @@ import math
 from time import sleep
 from typing import Any
 
+import numpy as np
 import scipy
 
-ITEMS_KEY = "items"
-OFFER_KEY = "offer"
-REQUEST_KEY = "request"
-CARDS_KEY = "cards"
-CARD_KEY = "card"
-CARD_ID_KEY = "cardId"
-OWNER_KEY = "owner"
-OWNER_ID_KEY = "owner_id"
-SEASON_KEY = "season"
-TRADE_COUNT_KEY = "tradeCount"
-ALTERNATES_KEY = "alternates"
-DIFFS_KEY = "diffs"
-ALTERNATES_COUNT_KEY = "alternatesCount"
-USER_KEY = "user"
-UPDATED_KEY = "updated_at"
-DATE_FORMAT = "%Y-%m-%d"
-
-CASE_KEY = "case"
-CASE_GRADED_KEY = "graded"
-CASE_SLEEVE_KEY = "sleeve"
-CASE_CENTERPIECE_KEY = "centerpiece"
-RARITY_KEY = "rarity"
-RARITY_GREEN_KEY = "green"
-RARITY_GOLD_KEY = "gold"
-RARITY_RED_KEY = "red"
-RARITY_BLUE_KEY = "blue"
-RARITY_PURPLE_KEY = "purple"
-RARITY_SILVER_KEY = "silver"
-RARITY_PINK_KEY = "pink"
-RARITY_RAINBOW_KEY = "rainbow"
-RARITY_BLACK_KEY = "black"
-RARITY_FULLART_KEY = "fullart"
-RARITY_PROMO_KEY = "promo"
-RARITY_MONOCHROME_KEY = "monochrome"
-STAMPED_KEY = "stamped"
-STAMPED_GOLD_KEY = "gold"
-STAMPED_BLUE_KEY = "blue"
-STAMPED_RED_KEY = "red"
-REDEEMED_KEY = "redeemed"
-GRADE_OVERALL_KEY = "grade_overall"
-CARD_NUM_KEY = "cardnum"
-SERIES_MAX_KEY = "seriesmax"
-PROP_LIST_KEY = "prop_list"
-
-CASE_GRADED_INDEX = 0
-CASE_SLEEVE_INDEX = 1
-CASE_CENTERPIECE_INDEX = 2
-RARITY_GREEN_INDEX = 3
-RARITY_GOLD_INDEX = 4
-RARITY_RED_INDEX = 5
-RARITY_BLUE_INDEX = 6
-RARITY_PURPLE_INDEX = 7
-RARITY_SILVER_INDEX = 8
-RARITY_PINK_INDEX = 9
-RARITY_RAINBOW_INDEX = 10
-RARITY_BLACK_INDEX = 11
-RARITY_FULLART_INDEX = 12
-RARITY_PROMO_INDEX = 13
-RARITY_MONOCHROME_INDEX = 14
-STAMPED_GOLD_INDEX = 15
-STAMPED_BLUE_INDEX = 16
-STAMPED_RED_INDEX = 17
-UNREDEEMED_INDEX = 18
-GRADE_10_INDEX = 19
-GRADE_9_INDEX = 20
-GRADE_8_INDEX = 21
-GRADE_7_INDEX = 22
-GRADE_6_INDEX = 23
-GRADE_5_INDEX = 24
-CARD_NUM_MIN_INDEX = 25
-CARD_NUM_MAX_INDEX = 26
-
-PROP_INDEX_TO_NAME = {
-    CASE_GRADED_INDEX: "case_graded",
-    CASE_SLEEVE_INDEX: "case_sleeve",
-    CASE_CENTERPIECE_INDEX: "case_centerpiece",
-    RARITY_GREEN_INDEX: "rarity_green",
-    RARITY_GOLD_INDEX: "rarity_gold",
-    RARITY_RED_INDEX: "rarity_red",
-    RARITY_BLUE_INDEX: "rarity_blue",
-    RARITY_PURPLE_INDEX: "rarity_purple",
-    RARITY_SILVER_INDEX: "rarity_silver",
-    RARITY_PINK_INDEX: "rarity_pink",
-    RARITY_RAINBOW_INDEX: "rarity_rainbow",
-    RARITY_BLACK_INDEX: "rarity_black",
-    RARITY_FULLART_INDEX: "rarity_fullart",
-    RARITY_PROMO_INDEX: "rarity_promo",
-    RARITY_MONOCHROME_INDEX: "rarity_monochrome",
-    STAMPED_GOLD_INDEX: "stamped_gold",
-    STAMPED_BLUE_INDEX: "stamped_blue",
-    STAMPED_RED_INDEX: "stamped_red",
-    UNREDEEMED_INDEX: "unredeemed",
-    GRADE_10_INDEX: "grade_10",
-    GRADE_9_INDEX: "grade_9",
-    GRADE_8_INDEX: "grade_8",
-    GRADE_7_INDEX: "grade_7",
-    GRADE_6_INDEX: "grade_6",
-    GRADE_5_INDEX: "grade_5",
-    CARD_NUM_MIN_INDEX: "card_num_min",
-    CARD_NUM_MAX_INDEX: "card_num_max",
-}
+from etl.records import Trade, dedupe_trades, load_trades
+from etl.snapshot import build_snapshot
+from etl.trade_arrays import encode_trade_lists, encode_trades, get_parameter_scales, minimize_weighted_errors
+from etl.valuation import PROP_INDEX_TO_NAME, get_card_value, get_period
+
+# weight of the penalty on an estimate changing between consecutive periods, relative to how strongly the trades of
+# those periods constrain it
+SMOOTHNESS_WEIGHT = 0.1
 
 
 # writes vals as a json file with the provided name
@@ -116,167 +24,60 @@ def write_json(vals: Any, name: str):
         out_file.write(json_object)
 
 
-# converts a string representation of a timestamp into a datetime.date object
-def string_to_date(string: str) -> datetime.date:
-    return datetime.datetime.strptime(string.split("T")[0], DATE_FORMAT).date()
-
-
-# given a list of trades, returns a list of the trades where at least one card was exchanged for at least one card
-def filter_trades(trades: list[Any]) -> list[Any]:
-    filtered = []
-    for trade in trades:
-        valid = len(trade[OFFER_KEY][CARDS_KEY]) and len(trade[REQUEST_KEY][CARDS_KEY])
-        if valid:
-            filtered.append(trade)
-    return filtered
-
-
-# given card data, stores a list of all the card's properties on the card and returns the list
-def load_card_props(card: Any) -> list[int]:
-    if card.get(PROP_LIST_KEY):
-        return card[PROP_LIST_KEY]
-
-    props = []
-
-    case = card[CASE_KEY]
-    rarity = card[RARITY_KEY]
-    stamped = card[STAMPED_KEY]
-    redeemed = card[REDEEMED_KEY]
-    grade = card[GRADE_OVERALL_KEY]
-    card_num = card[CARD_NUM_KEY]
-    series_max = card[SERIES_MAX_KEY]
-
-    if case == CASE_GRADED_KEY:
-        props.append(CASE_GRADED_INDEX)
-    if case == CASE_SLEEVE_KEY:
-        props.append(CASE_SLEEVE_INDEX)
-    if case == CASE_CENTERPIECE_KEY:
-        props.append(CASE_CENTERPIECE_INDEX)
-
-    if rarity == RARITY_GREEN_KEY:
-        props.append(RARITY_GREEN_INDEX)
-    if rarity == RARITY_GOLD_KEY:
-        props.append(RARITY_GOLD_INDEX)
-    if rarity == RARITY_RED_KEY:
-        props.append(RARITY_RED_INDEX)
-    if rarity == RARITY_BLUE_KEY:
-        props.append(RARITY_BLUE_INDEX)
-    if rarity == RARITY_PURPLE_KEY:
-        props.append(RARITY_PURPLE_INDEX)
-    if rarity == RARITY_SILVER_KEY:
-        props.append(RARITY_SILVER_INDEX)
-    if rarity == RARITY_PINK_KEY:
-        props.append(RARITY_PINK_INDEX)
-    if rarity == RARITY_RAINBOW_KEY:
-        props.append(RARITY_RAINBOW_INDEX)
-    if rarity == RARITY_BLACK_KEY:
-        props.append(RARITY_BLACK_INDEX)
-    if rarity == RARITY_FULLART_KEY:
-        props.append(RARITY_FULLART_INDEX)
-    if rarity == RARITY_PROMO_KEY:
-        props.append(RARITY_PROMO_INDEX)
-    if rarity == RARITY_MONOCHROME_KEY:
-        props.append(RARITY_MONOCHROME_INDEX)
-
-    if stamped == STAMPED_GOLD_KEY:
-        props.append(STAMPED_GOLD_INDEX)
-    if stamped == STAMPED_BLUE_KEY:
-        props.append(STAMPED_BLUE_INDEX)
-    if stamped == STAMPED_RED_KEY:
-        props.append(STAMPED_RED_INDEX)
-
-    if redeemed is False:
-        props.append(UNREDEEMED_INDEX)
-
-    if grade:
-        if int(grade) == 10:
-            props.append(GRADE_10_INDEX)
-        if int(grade) == 9:
-            props.append(GRADE_9_INDEX)
-        if int(grade) == 8:
-            props.append(GRADE_8_INDEX)
-        if int(grade) == 7:
-            props.append(GRADE_7_INDEX)
-        if int(grade) == 6:
-            props.append(GRADE_6_INDEX)
-        if int(grade) == 5:
-            props.append(GRADE_5_INDEX)
-
-    if series_max > 1:
-        if card_num == 1:
-            props.append(CARD_NUM_MIN_INDEX)
-        if card_num == series_max:
-            props.append(CARD_NUM_MAX_INDEX)
-
-    card[PROP_LIST_KEY] = props
-    return props
-
-
-# given the estimates of card and property values, returns the value estimate of a mint (specific copy of a card)
-def get_card_value(
-        values: list[float],
-        locations: dict[int, int],
-        prop_locations: dict[int, int],
-        mult_locations: dict[int, int],
-        card: Any
-) -> float:
-    props = load_card_props(card)
-    card_location = locations[card[CARD_KEY]]
-    prop_locs = [prop_locations[prop] for prop in props]
-    mult_locs = [mult_locations[prop] for prop in props]
-
-    basest_value = values[card_location]
-    prop_values = [values[loc] for loc in prop_locs]
-    prop_mults = [values[loc] for loc in mult_locs]
-
-    baser_value = basest_value + sum(prop_values)
-    mult_bonus = sum([mult * baser_value for mult in prop_mults])
-    return baser_value + mult_bonus
-
-
 # given the estimates of card and property values, returns the sum of the square errors of all trades
+# each trade's square error is counted as many times as its weight
 def find_error(
         values: list[float],
         locations: dict[int, int],
         prop_locations: dict[int, int],
         mult_locations: dict[int, int],
-        trades: list[Any]
+        trades: list[Trade],
+        weights: list[int]
 ) -> float:
     error = 0
-    for trade in trades:
+    for trade, weight in zip(trades, weights):
         offer = sum([
-            get_card_value(values, locations, prop_locations, mult_locations, card)
-            for card in trade[OFFER_KEY][CARDS_KEY]
+            get_card_value(values, locations, prop_locations, mult_locations, mint)
+            for mint in trade.offer
         ])
         request = sum([
-            get_card_value(values, locations, prop_locations, mult_locations, card)
-            for card in trade[REQUEST_KEY][CARDS_KEY]
+            get_card_value(values, locations, prop_locations, mult_locations, mint)
+            for mint in trade.request
         ])
-        error += (offer - request) ** 2
+        error += weight * (offer - request) ** 2
     return error
 
 
 # returns the estimates of card and property values which minimize the sum of the square errors of all trades
+# when scaled, the optimizer works on the estimates divided by the scales of trade_arrays.get_parameter_scales, which
+# improves the conditioning of the problem, the returned estimates are in the same units either way
 def minimize_errors(
-        trades: list[Any],
+        trades: list[Trade],
         previous_values: dict[int, float],
         prop_previous_values: dict[int, float],
-        prop_previous_mult: dict[int, float]
+        prop_previous_mult: dict[int, float],
+        scaled: bool = False
         # tuple[dict[card_id, card_value], dict[prop_id, prop_value], dict[prop_id, prop_mult]]
 ) -> tuple[dict[int, int], dict[int, int], dict[int, int]]:
+    # identical trades contribute identical errors, so each is evaluated once and weighted by its count
+    trade_count = len(trades)
+    trades, weights = dedupe_trades(trades)
+    print(f"deduplicated {trade_count} trades into {len(trades)} weighted trades "
+          f"({trade_count / len(trades):.2f}x reduction)")
+
     all_cards = []
     all_props = set()
     locations: dict[int, int] = {}
     prop_location: dict[int, int] = {}
     mult_location: dict[int, int] = {}
     for trade in trades:
-        for party in (trade[OFFER_KEY], trade[REQUEST_KEY]):
-            for card in party[CARDS_KEY]:
-                all_cards.append(card)
-                all_props.update(load_card_props(card))
+        for party in (trade.offer, trade.request):
+            for mint in party:
+                all_cards.append(mint)
+                all_props.update(mint.props)
 
-    for i, card in enumerate(all_cards):
-        card_id = card[CARD_KEY]
+    for i, mint in enumerate(all_cards):
+        card_id = mint.card
         if card_id not in locations:
             locations[card_id] = i
 
@@ -297,50 +98,140 @@ def minimize_errors(
         if k in prop_previous_mult:
             start_values[v] = prop_previous_mult[k]
 
+    scales = np.ones(len(start_values))
+    if scaled:
+        arrays, card_ids, props = encode_trades(trades)
+        positions = ([locations[k] for k in card_ids] + [prop_location[k] for k in props] +
+                     [mult_location[k] for k in props])
+        scales[positions] = get_parameter_scales(arrays, np.array(weights, dtype=float),
+                                                 np.array([start_values[v] for v in positions], dtype=float),
+                                                 len(card_ids), len(props))
+
+    lower_bounds = ([1] * len(all_cards)) + ([0] * (len(all_props) * 2))
     results = scipy.optimize.minimize(
-        lambda estimates: find_error(estimates, locations, prop_location, mult_location, trades),
-        start_values,
-        bounds=([(1, None)] * len(all_cards)) + ([(0, None)] * (len(all_props) * 2))
+        lambda estimates: find_error(estimates * scales, locations, prop_location, mult_location, trades, weights),
+        np.array(start_values, dtype=float) / scales,
+        bounds=[(bound / scale, None) for bound, scale in zip(lower_bounds, scales)]
     )
+    estimates = np.maximum(results.x * scales, lower_bounds)
+    print(f"converged in {results.nit} iterations")
 
     return (
-        {k: results.x[v] for k, v in locations.items()},
-        {k: results.x[v] for k, v in prop_location.items()},
-        {k: results.x[v] for k, v in mult_location.items()},
+        {k: estimates[v] for k, v in locations.items()},
+        {k: estimates[v] for k, v in prop_location.items()},
+        {k: estimates[v] for k, v in mult_location.items()},
     )
 
 
-# given a date and offset, returns the first day of the quarter in which the date (with offset) took place
-def get_period(date: datetime.date, offset: int = 0) -> datetime.date:
-    year = date.year
-    raw_month = date.month + offset
-    raw_month = raw_month if raw_month <= 12 else raw_month - 12
-    month = (raw_month - ((raw_month - 1) % 3))
-    return datetime.date(year, month, 1)
+# returns the trades binned by the period (with offset) in which they took place, in order of the periods
+def bin_trades(trades: list[Trade], offset: int = 0) -> dict[datetime.date, list[Trade]]:
+    trades_by_period = {}
+    for trade in trades:
+        period = get_period(datetime.date.fromordinal(trade.date), offset)
+        if period not in trades_by_period:
+            trades_by_period[period] = []
+        trades_by_period[period].append(trade)
+    return {k: trades_by_period[k] for k in sorted(trades_by_period.keys())}
+
+
+# returns the weight of the penalty tying an estimate to the same estimate of the previous period it was traded in, given
+# the curvature of the error along the estimate in both periods
+def get_smoothness_weight(curvature: float, previous_curvature: float,
+                          smoothness_weight: float = SMOOTHNESS_WEIGHT) -> float:
+    return math.sqrt(smoothness_weight * (curvature + previous_curvature) / 2)
+
+
+# returns the estimates of card and property values of every period, minimizing the sum of the square errors of all
+# trades plus a penalty on the square of the change of each estimate between consecutive periods it is traded in
+# all periods are solved at once as a single sparse problem, each period with its own estimates
+def minimize_joint_errors(
+        trades_by_period: dict[datetime.date, list[Trade]],
+        smoothness_weight: float = SMOOTHNESS_WEIGHT
+        # dict[period, tuple[dict[card_id, card_value], dict[prop_id, prop_value], dict[prop_id, prop_mult]]]
+) -> dict[datetime.date, tuple[dict[int, float], dict[int, float], dict[int, float]]]:
+    periods = list(trades_by_period.keys())
+    trade_lists = []
+    weights = []
+    for trades in trades_by_period.values():
+        unique_trades, trade_weights = dedupe_trades(trades)
+        trade_lists.append(unique_trades)
+        weights += trade_weights
+    weights = np.array(weights, dtype=float)
+    arrays, card_keys, prop_keys = encode_trade_lists(trade_lists)
+    card_count = len(card_keys)
+    prop_count = len(prop_keys)
+    start_values = np.ones(card_count + 2 * prop_count)
+    print(f"minimizing {card_count} card and {prop_count} prop estimates over {len(periods)} periods")
+
+    # each estimate is tied to the same estimate of the previous period it was traded in, weighted by how strongly the
+    # trades of both periods constrain it so the penalty is in the units of the trade errors
+    curvature = get_parameter_scales(arrays, weights, start_values, card_count, prop_count) ** -2
+    rows, columns, entries = [], [], []
+    for keys, offsets in ((card_keys, (0,)), (prop_keys, (card_count, card_count + prop_count))):
+        previous_positions = {}
+        for position, (_, key) in enumerate(keys):
+            if key in previous_positions:
+                for offset in offsets:
+                    current = position + offset
+                    previous = previous_positions[key] + offset
+                    weight = get_smoothness_weight(curvature[current], curvature[previous], smoothness_weight)
+                    rows += [len(rows) // 2] * 2
+                    columns += [current, previous]
+                    entries += [weight, -weight]
+            previous_positions[key] = position
+    smoothness = scipy.sparse.csr_matrix((entries, (rows, columns)), shape=(len(rows) // 2, len(start_values)))
+
+    results = minimize_weighted_errors(arrays, weights, start_values, card_count, prop_count, True, smoothness)
+    print(f"converged in {results.nit} iterations")
+
+    estimates = {period: ({}, {}, {}) for period in periods}
+    for (i, card_id), value in zip(card_keys, results.x[:card_count].tolist()):
+        estimates[periods[i]][0][card_id] = value
+    for (i, prop), value, mult in zip(prop_keys, results.x[card_count:card_count + prop_count].tolist(),
+                                      results.x[card_count + prop_count:].tolist()):
+        estimates[periods[i]][1][prop] = value
+        estimates[periods[i]][2][prop] = mult
+    return estimates
+
+
+# computes the estimates of card and property values of every quarter in a single joint solve and writes them to the
+# master data files
+def get_joint_card_values(smoothness_weight: float = SMOOTHNESS_WEIGHT):
+    trades_by_period = bin_trades(load_trades("trades.json"))
+    estimates = minimize_joint_errors(trades_by_period, smoothness_weight)
+
+    all_card_values = {}
+    all_prop_values = {}
+    all_prop_mults = {}
+    # values are stored latest period first
+    for period, (card_values, prop_values, prop_mults) in reversed(estimates.items()):
+        for card, value in card_values.items():
+            if card not in all_card_values:
+                all_card_values[card] = {}
+            all_card_values[card][str(period)] = math.floor(value * 10000)
+
+        for prop, value in prop_values.items():
+            if PROP_INDEX_TO_NAME[prop] not in all_prop_values:
+                all_prop_values[PROP_INDEX_TO_NAME[prop]] = {}
+            all_prop_values[PROP_INDEX_TO_NAME[prop]][str(period)] = math.floor(value * 10000)
+
+        for prop, mult in prop_mults.items():
+            if PROP_INDEX_TO_NAME[prop] not in all_prop_mults:
+                all_prop_mults[PROP_INDEX_TO_NAME[prop]] = {}
+            all_prop_mults[PROP_INDEX_TO_NAME[prop]][str(period)] = round(mult, 5)
+
+    write_master_values(all_card_values, all_prop_values, all_prop_mults)
 
 
 # computes the estimates of card and property values and writes them to data files
-def get_card_values():
-    with open("trades.json") as trade_file:
-        all_trades = filter_trades(json.load(trade_file))
-        # Below will trim trade dataset for debugging
-        # filter_ratio = 80
-        # all_trades = [trade for index, trade in enumerate(all_trades) if (index % filter_ratio) == 0][:100]
-    trades_by_period_bins = []
-    for offset in (0, 1, 2):
-        trades_by_period = {}
-        for trade in all_trades:
-            period = get_period(string_to_date(trade[UPDATED_KEY]), offset)
-            if period not in trades_by_period:
-                trades_by_period[period] = []
-            trades_by_period[period].append(trade)
-        trades_by_period = {k: trades_by_period[k] for k in sorted(trades_by_period.keys())}
-        trades_by_period_bins.append(trades_by_period)
-
-    for trade in all_trades:
-        for party in (trade[OFFER_KEY], trade[REQUEST_KEY]):
-            for card in party[CARDS_KEY]:
-                load_card_props(card)
+# scaled selects the rescaled parameterization of minimize_errors
+def get_card_values(scaled: bool = False):
+    all_trades = load_trades("trades.json")
+    # Below will trim trade dataset for debugging
+    # filter_ratio = 80
+    # all_trades = [trade for index, trade in enumerate(all_trades) if (index % filter_ratio) == 0][:100]
+    # every binning references the same trade records
+    trades_by_period_bins = [bin_trades(all_trades, offset) for offset in (0, 1, 2)]
 
     previous_cards = {}
     previous_props = {}
@@ -364,7 +255,7 @@ def get_card_values():
         for period, trades in all_trades:
             print("optimizing " + str(len(trades)) + " trades in period " + str(period))
             card_values, prop_values, prop_mults = minimize_errors(trades, previous_cards, previous_props,
-                                                                   previous_mults)
+                                                                   previous_mults, scaled)
 
             for card, value in card_values.items():
                 previous_cards[card] = value
@@ -426,10 +317,15 @@ def get_card_values():
         for key, values in list(entry_dict.items()):
             entry_dict[key] = {k: values[k] for k in sorted(values.keys(), reverse=True)}
 
-    all_card_values = master_dict["card_values"]
-    all_prop_values = master_dict["prop_values"]
-    all_prop_mults = master_dict["prop_mults"]
+    write_master_values(master_dict["card_values"], master_dict["prop_values"], master_dict["prop_mults"])
 
+
+# writes the values of every period as the master data files, along with the snapshot built from them
+def write_master_values(
+        all_card_values: dict[str, dict[str, int]],
+        all_prop_values: dict[str, dict[str, int]],
+        all_prop_mults: dict[str, dict[str, float]]
+):
     all_card_values = {k: all_card_values[k] for k in
                        sorted(all_card_values.keys(), key=lambda x: -len(all_card_values[x]))}
     write_json(all_card_values, "values/master_card_values")
@@ -444,7 +340,11 @@ def get_card_values():
     all_prop_mults = {k: all_prop_mults[k] for k in sorted(all_prop_mults.keys())}
     write_json(all_prop_mults, "values/master_prop_mults")
 
+    build_snapshot("values/master_card_values.json", "values/master_prop_values.json", "values/master_prop_mults.json",
+                   "values/snapshot.npz")
+
 
-# note, this script takes an obscene amount of time to run
+# run it from the repository root with `python -m etl.evaluate` so the etl package can be imported
+# get_card_values, which sweeps over the periods instead, takes an obscene amount of time to run
 if __name__ == '__main__':
-    get_card_values()
+    get_joint_card_values()
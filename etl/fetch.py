@@ -5,6 +5,8 @@ from typing import Any
 
 import requests
 
+from etl.valuation import index_card_trades
+
 URL = "https://tvoee3zqq5.execute-api.us-east-1.amazonaws.com/v2/trades"
 BIN_SIZE = 50
 ITEMS_KEY = "items"
@@ -85,19 +87,19 @@ def get_trades():
     write_json(trades, "trades")
 
 
-# finds all the unique cards among trades and writes them to a data file
+# finds all the unique cards among trades and writes them to a data file, with the number of trades each took part in
 def get_cards():
     with open("trades.json") as trade_file:
         all_trades = json.load(trade_file)
+    card_trades = index_card_trades(all_trades)
     all_cards = {}
-    for trade in all_trades:
-        for party in (trade[OFFER_KEY], trade[REQUEST_KEY]):
-            for card in party[CARDS_KEY]:
-                card_id = card[CARD_KEY]
-                if card_id not in all_cards:
-                    all_cards[card_id] = card
-                    all_cards[card_id][TRADE_COUNT_KEY] = 0
-                all_cards[card_id][TRADE_COUNT_KEY] += 1
+    for card_id, positions in card_trades.items():
+        trade = all_trades[positions[0]]
+        all_cards[card_id] = next(
+            card for party in (trade[OFFER_KEY], trade[REQUEST_KEY]) for card in party[CARDS_KEY]
+            if card[CARD_KEY] == card_id
+        )
+        all_cards[card_id][TRADE_COUNT_KEY] = len(positions)
 
     all_cards = {k: all_cards[k] for k in sorted(all_cards.keys(), key=lambda k: -all_cards[k][TRADE_COUNT_KEY])}
     write_json(all_cards, "cards")
@@ -144,6 +146,7 @@ def get_variations():
     write_json(rarities, "rarities")
 
 
+# run from the repository root with `python -m etl.fetch`
 if __name__ == '__main__':
     get_trades()
     get_cards()
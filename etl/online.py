@@ -0,0 +1,259 @@
+import datetime
+import json
+import math
+
+import numpy as np
+import scipy
+
+from etl.evaluate import bin_trades, get_smoothness_weight, write_json, write_master_values
+from etl.records import Trade, dedupe_trades, load_trades
+from etl.trade_arrays import encode_trades, get_parameter_scales, get_residual_jacobian, minimize_weighted_errors
+from etl.valuation import DATE_FORMAT, PROP_INDEX_TO_NAME, get_period
+
+STATE_FILE = "values/online_state"
+MASTER_CARD_VALUES_FILE = "values/master_card_values.json"
+MASTER_PROP_VALUES_FILE = "values/master_prop_values.json"
+MASTER_PROP_MULTS_FILE = "values/master_prop_mults.json"
+# the quarter's trades are re-solved in full once this many trades have been applied online since the last solve
+RECONCILE_TRADE_COUNT = 500
+# an online step moves an estimate by at most this fraction of its value (or of 1, for estimates smaller than 1)
+MAX_STEP_RATIO = 0.5
+# published card and prop values are the estimates multiplied by this and floored
+VALUE_SCALE = 10000
+# estimates of cards and props which have not been traded yet start where minimize_errors starts them
+START_VALUE = 1
+
+CARD_BLOCK = 0
+PROP_VALUE_BLOCK = 1
+PROP_MULT_BLOCK = 2
+BLOCK_KEYS = ("card_values", "prop_values", "prop_mults")
+# the lowest value each block of estimates may take, as in minimize_errors
+LOWER_BOUNDS = (1, 0, 0)
+
+PERIOD_KEY = "period"
+TRADE_IDS_KEY = "trade_ids"
+UPDATE_COUNT_KEY = "update_count"
+VALUES_KEY = "values"
+PRECISIONS_KEY = "precisions"
+
+PROP_NAME_TO_INDEX = {name: index for index, name in PROP_INDEX_TO_NAME.items()}
+
+
+# the OnlineState class holds the estimates of the current quarter between fetches
+# every estimate has a precision, the sum over the quarter's trades of the square of the derivative of the trade's
+# residual with respect to the estimate, which decides how far a new trade may move it
+class OnlineState:
+    def __init__(self, period: datetime.date, values: tuple[dict[int, float], dict[int, float], dict[int, float]]):
+        self.period = period
+        self.values = values
+        self.precisions: tuple[dict[int, float], dict[int, float], dict[int, float]] = ({}, {}, {})
+        # ids of the quarter's trades which the estimates account for
+        self.trade_ids: set[int] = set()
+        # number of trades applied online since the last full solve
+        self.update_count = 0
+
+
+# returns the online state saved at state_file, or None if there is none
+def load_state(state_file: str) -> OnlineState | None:
+    try:
+        with open(state_file + ".json") as in_file:
+            saved = json.load(in_file)
+    except FileNotFoundError:
+        return None
+
+    values = tuple({int(k): v for k, v in saved[VALUES_KEY][key].items()} for key in BLOCK_KEYS)
+    state = OnlineState(datetime.datetime.strptime(saved[PERIOD_KEY], DATE_FORMAT).date(), values)
+    state.precisions = tuple({int(k): v for k, v in saved[PRECISIONS_KEY][key].items()} for key in BLOCK_KEYS)
+    state.trade_ids = set(saved[TRADE_IDS_KEY])
+    state.update_count = saved[UPDATE_COUNT_KEY]
+    return state
+
+
+# writes the online state to state_file
+def save_state(state: OnlineState, state_file: str):
+    write_json({
+        PERIOD_KEY: str(state.period),
+        UPDATE_COUNT_KEY: state.update_count,
+        TRADE_IDS_KEY: sorted(state.trade_ids),
+        VALUES_KEY: {key: state.values[i] for i, key in enumerate(BLOCK_KEYS)},
+        PRECISIONS_KEY: {key: state.precisions[i] for i, key in enumerate(BLOCK_KEYS)},
+    }, state_file)
+
+
+# returns the latest published estimates dated at or before period from the master value files, in the units of the
+# optimizer, or no estimates if the files do not exist yet
+def load_master_estimates(period: datetime.date) -> tuple[dict[int, float], dict[int, float], dict[int, float]]:
+    estimates = ({}, {}, {})
+    for i, (file_name, to_index) in enumerate((
+            (MASTER_CARD_VALUES_FILE, int),
+            (MASTER_PROP_VALUES_FILE, PROP_NAME_TO_INDEX.get),
+            (MASTER_PROP_MULTS_FILE, PROP_NAME_TO_INDEX.get),
+    )):
+        try:
+            with open(file_name) as in_file:
+                published = json.load(in_file)
+        except FileNotFoundError:
+            continue
+        for key, dated_values in published.items():
+            # dates are stored latest first
+            value = next((v for date, v in dated_values.items() if date <= str(period)), None)
+            if value is not None:
+                estimates[i][to_index(key)] = value if i == PROP_MULT_BLOCK else value / VALUE_SCALE
+    return estimates
+
+
+# returns the (block, card id or prop) key of every estimate laid out as in encode_trades
+def get_keys(card_ids: list[int], props: list[int]) -> list[tuple[int, int]]:
+    return [(CARD_BLOCK, card) for card in card_ids] + [(PROP_VALUE_BLOCK, prop) for prop in props] + \
+        [(PROP_MULT_BLOCK, prop) for prop in props]
+
+
+# returns the curvature of the error of the trades along every estimate, as minimize_joint_errors weighs its smoothness
+# penalty, keyed as in get_keys
+def get_curvatures(trades: list[Trade]) -> dict[tuple[int, int], float]:
+    unique_trades, weights = dedupe_trades(trades)
+    arrays, card_ids, props = encode_trades(unique_trades)
+    start_values = np.ones(len(card_ids) + 2 * len(props))
+    scales = get_parameter_scales(arrays, np.array(weights, dtype=float), start_values, len(card_ids), len(props))
+    return dict(zip(get_keys(card_ids, props), (scales ** -2).tolist()))
+
+
+# solves the quarter's trades in full starting from the current estimates and resets the precisions of the estimates to
+# those of the solution. As in minimize_joint_errors, each estimate is tied to its published value in the latest earlier
+# quarter it was traded in, so the result matches what get_joint_card_values publishes for the quarter
+def reconcile(state: OnlineState, trades: list[Trade], earlier_trades: list[Trade]):
+    unique_trades, weights = dedupe_trades(trades)
+    weights = np.array(weights, dtype=float)
+    arrays, card_ids, props = encode_trades(unique_trades)
+    keys = get_keys(card_ids, props)
+    start_values = np.array([state.values[block].get(key, START_VALUE) for block, key in keys], dtype=float)
+
+    curvatures = get_curvatures(trades)
+    previous_curvatures = {}
+    for period_trades in bin_trades(earlier_trades).values():
+        previous_curvatures.update(get_curvatures(period_trades))
+    previous_values = load_master_estimates(state.period - datetime.timedelta(days=1))
+    columns, weights_by_column, offsets = [], [], []
+    for column, (block, key) in enumerate(keys):
+        if key in previous_values[block] and (block, key) in previous_curvatures:
+            weight = get_smoothness_weight(curvatures[(block, key)], previous_curvatures[(block, key)])
+            columns.append(column)
+            weights_by_column.append(weight)
+            offsets.append(weight * previous_values[block][key])
+    penalty = scipy.sparse.csr_matrix((weights_by_column, (range(len(columns)), columns)),
+                                      shape=(len(columns), len(keys)))
+
+    results = minimize_weighted_errors(arrays, weights, start_values, len(card_ids), len(props), True, penalty,
+                                       np.array(offsets, dtype=float))
+    jacobian = get_residual_jacobian(results.x, arrays, len(unique_trades), len(card_ids), len(props))
+    precisions = jacobian.multiply(jacobian).T @ weights + penalty.multiply(penalty).sum(axis=0).A1
+
+    state.precisions = ({}, {}, {})
+    for (block, key), value, precision in zip(keys, results.x.tolist(), precisions.tolist()):
+        state.values[block][key] = max(value, LOWER_BOUNDS[block])
+        state.precisions[block][key] = precision
+    state.trade_ids = {trade.id for trade in trades}
+    state.update_count = 0
+    print(f"reconciled {len(trades)} trades of {state.period} in {results.nit} iterations")
+
+
+# moves the estimates of the cards and props in the trade towards making the trade fair, returning the trade's residual
+# (offered minus requested value) before the step
+# this is a recursive least squares step with the precisions standing in for the diagonal of the information matrix
+# the step removes a fraction of the residual which grows with how little is known of the trade's estimates, but is
+# always less than all of it, and each estimate is moved by at most MAX_STEP_RATIO of its value
+def apply_trade(state: OnlineState, trade: Trade) -> float:
+    values = state.values
+    residual = 0
+    gradient: dict[tuple[int, int], float] = {}
+    for sign, party in ((1, trade.offer), (-1, trade.request)):
+        for mint in party:
+            base = values[CARD_BLOCK].setdefault(mint.card, START_VALUE)
+            mult = 1
+            for prop in mint.props:
+                base += values[PROP_VALUE_BLOCK].setdefault(prop, START_VALUE)
+                mult += values[PROP_MULT_BLOCK].setdefault(prop, START_VALUE)
+            residual += sign * base * mult
+
+            gradient[(CARD_BLOCK, mint.card)] = gradient.get((CARD_BLOCK, mint.card), 0) + sign * mult
+            for prop in mint.props:
+                gradient[(PROP_VALUE_BLOCK, prop)] = gradient.get((PROP_VALUE_BLOCK, prop), 0) + sign * mult
+                gradient[(PROP_MULT_BLOCK, prop)] = gradient.get((PROP_MULT_BLOCK, prop), 0) + sign * base
+
+    gain = 0
+    for (block, key), derivative in gradient.items():
+        state.precisions[block][key] = state.precisions[block].get(key, 0) + derivative ** 2
+        if derivative:
+            gain += derivative ** 2 / state.precisions[block][key]
+
+    for (block, key), derivative in gradient.items():
+        if not derivative:
+            continue
+        value = values[block][key]
+        limit = MAX_STEP_RATIO * max(abs(value), 1)
+        step = -residual * derivative / state.precisions[block][key] / (1 + gain)
+        values[block][key] = max(value + min(max(step, -limit), limit), LOWER_BOUNDS[block])
+
+    state.trade_ids.add(trade.id)
+    state.update_count += 1
+    return residual
+
+
+# writes the estimates of the quarter's traded cards and props into the master value files, as get_card_values would
+def write_period_values(state: OnlineState):
+    master = []
+    for file_name in (MASTER_CARD_VALUES_FILE, MASTER_PROP_VALUES_FILE, MASTER_PROP_MULTS_FILE):
+        try:
+            with open(file_name) as in_file:
+                master.append(json.load(in_file))
+        except FileNotFoundError:
+            master.append({})
+
+    period = str(state.period)
+    # estimates without a precision were carried over from an earlier quarter and are not traded in this one
+    for block, names in ((CARD_BLOCK, str), (PROP_VALUE_BLOCK, PROP_INDEX_TO_NAME.get),
+                         (PROP_MULT_BLOCK, PROP_INDEX_TO_NAME.get)):
+        for key, precision in state.precisions[block].items():
+            value = state.values[block][key]
+            dated_values = master[block].setdefault(names(key), {})
+            dated_values[period] = round(value, 5) if block == PROP_MULT_BLOCK else math.floor(value * VALUE_SCALE)
+            master[block][names(key)] = {k: dated_values[k] for k in sorted(dated_values.keys(), reverse=True)}
+
+    write_master_values(*master)
+
+
+# applies the accepted trades of trades.json which the estimates of the current quarter do not account for yet, then
+# publishes the quarter's estimates. The quarter is solved in full when it starts, when there is no saved state, and
+# after every reconcile_trade_count trades applied online
+def update_online_values(state_file: str = STATE_FILE, reconcile_trade_count: int = RECONCILE_TRADE_COUNT):
+    all_trades = load_trades("trades.json")
+    if not all_trades:
+        print("no trades to apply")
+        return
+    period = get_period(datetime.date.fromordinal(max(trade.date for trade in all_trades)))
+    trades = [trade for trade in all_trades if get_period(datetime.date.fromordinal(trade.date)) == period]
+    earlier_trades = [trade for trade in all_trades if get_period(datetime.date.fromordinal(trade.date)) != period]
+
+    state = load_state(state_file)
+    if state is None or state.period != period:
+        # a new quarter starts from the latest estimates, as the quarters of get_card_values are warm started
+        state = OnlineState(period, state.values if state else load_master_estimates(period))
+        reconcile(state, trades, earlier_trades)
+    else:
+        new_trades = sorted((trade for trade in trades if trade.id not in state.trade_ids),
+                            key=lambda trade: (trade.date, trade.id))
+        if state.update_count + len(new_trades) >= reconcile_trade_count:
+            reconcile(state, trades, earlier_trades)
+        else:
+            residuals = [apply_trade(state, trade) for trade in new_trades]
+            if residuals:
+                print(f"applied {len(new_trades)} trades of {period}, "
+                      f"mean absolute residual {sum(abs(r) for r in residuals) / len(residuals):.4g}")
+
+    save_state(state, state_file)
+    write_period_values(state)
+
+
+# run from the directory holding trades.json after every fetch with `python -m etl.online`
+if __name__ == '__main__':
+    update_online_values()
@@ -0,0 +1,82 @@
+import json
+from typing import Any
+
+from etl.valuation import (
+    CARDS_KEY,
+    CARD_KEY,
+    OFFER_KEY,
+    RARITY_KEY,
+    REQUEST_KEY,
+    TRADE_ID_KEY,
+    UPDATED_KEY,
+    load_card_props,
+    string_to_date,
+)
+
+
+# a mint (specific copy of a card) reduced to what the optimizer needs: the card id and its encoded props
+class Mint:
+    __slots__ = ("card", "props")
+
+    def __init__(self, card: int, props: tuple[int, ...]):
+        self.card = card
+        self.props = props
+
+
+# an accepted trade reduced to its id, the ordinal of its date, and the mints on each side
+class Trade:
+    __slots__ = ("id", "date", "offer", "request")
+
+    def __init__(self, trade_id: int, date: int, offer: tuple[Mint, ...], request: tuple[Mint, ...]):
+        self.id = trade_id
+        self.date = date
+        self.offer = offer
+        self.request = request
+
+
+# reads the trades data file, returning a record of every trade where at least one card was exchanged for at least one
+# card. Objects are projected as they are parsed so the full api payload is never held in memory
+def load_trades(file_name: str) -> list[Trade]:
+    # mints with the same props share a single tuple
+    prop_tuples: dict[tuple[int, ...], tuple[int, ...]] = {}
+
+    def project(obj: dict[str, Any]) -> Any:
+        if CARD_KEY in obj and RARITY_KEY in obj:
+            props = tuple(load_card_props(obj))
+            return Mint(obj[CARD_KEY], prop_tuples.setdefault(props, props))
+        if OFFER_KEY in obj and REQUEST_KEY in obj:
+            offer = obj[OFFER_KEY]
+            request = obj[REQUEST_KEY]
+            if not (offer and request):
+                return None
+            return Trade(obj[TRADE_ID_KEY], string_to_date(obj[UPDATED_KEY]).toordinal(), offer, request)
+        if CARDS_KEY in obj:
+            return tuple(obj[CARDS_KEY])
+        return obj
+
+    with open(file_name) as trade_file:
+        return [trade for trade in json.load(trade_file, object_hook=project) if trade is not None]
+
+
+# returns the key shared by every trade which the model cannot tell apart: the sorted (card, props) signatures of the
+# mints on each side. A trade and its mirror image have the same squared error, so the sides are put in a fixed order
+def get_trade_signature(trade: Trade) -> tuple:
+    offer = tuple(sorted((mint.card, mint.props) for mint in trade.offer))
+    request = tuple(sorted((mint.card, mint.props) for mint in trade.request))
+    return min((offer, request), (request, offer))
+
+
+# collapses trades with the same signature into one, returning the remaining trades and how many trades each stands for
+def dedupe_trades(trades: list[Trade]) -> tuple[list[Trade], list[int]]:
+    positions: dict[tuple, int] = {}
+    unique_trades = []
+    weights = []
+    for trade in trades:
+        signature = get_trade_signature(trade)
+        if signature in positions:
+            weights[positions[signature]] += 1
+        else:
+            positions[signature] = len(unique_trades)
+            unique_trades.append(trade)
+            weights.append(1)
+    return unique_trades, weights
@@ -0,0 +1,164 @@
+import datetime
+import hashlib
+import json
+import struct
+import zipfile
+from typing import Any
+
+import numpy as np
+
+from etl.valuation import DATE_FORMAT
+
+SNAPSHOT_SCHEMA_VERSION = 1
+NPY_SUFFIX = ".npy"
+ZIP_LOCAL_HEADER_SIZE = 30
+
+SCHEMA_VERSION_KEY = "schema_version"
+CHECKSUM_KEY = "checksum"
+SOURCE_DIGEST_KEY = "source_digest"
+QUARTERS_KEY = "quarters"
+CARD_IDS_KEY = "card_ids"
+CARD_VALUES_KEY = "card_values"
+PROP_NAMES_KEY = "prop_names"
+PROP_VALUES_KEY = "prop_values"
+PROP_MULTS_KEY = "prop_mults"
+
+
+# returns the sha256 digest of the contents of the provided files, used to tell which json files a snapshot was built from
+def get_source_digest(file_names: list[str]) -> str:
+    digest = hashlib.sha256()
+    for file_name in file_names:
+        with open(file_name, "rb") as source_file:
+            digest.update(source_file.read())
+    return digest.hexdigest()
+
+
+# returns the json object located at the file with name file_name
+def read_json(file_name: str) -> Any:
+    with open(file_name) as json_file:
+        return json.load(json_file)
+
+
+# returns the sha256 digest of every array in a snapshot except the checksum itself
+def get_checksum(arrays: dict[str, np.ndarray]) -> str:
+    digest = hashlib.sha256()
+    for key in sorted(arrays.keys()):
+        if key == CHECKSUM_KEY:
+            continue
+        array = np.ascontiguousarray(arrays[key])
+        digest.update(key.encode())
+        digest.update(array.dtype.str.encode())
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+# given values keyed by id then by date string, returns the matrix of values over the quarters, missing values are nan
+def to_matrix(values: dict[str, dict[str, float]], quarter_index: dict[str, int]) -> np.ndarray:
+    matrix = np.full((len(values), len(quarter_index)), np.nan)
+    for i, dated_values in enumerate(values.values()):
+        for date, value in dated_values.items():
+            matrix[i, quarter_index[date]] = value
+    return matrix
+
+
+# builds a binary snapshot of the card values, prop values and prop mults json files and writes it to snapshot_file
+def build_snapshot(card_values_file: str, prop_values_file: str, prop_mults_file: str, snapshot_file: str):
+    source_files = [card_values_file, prop_values_file, prop_mults_file]
+    card_values, prop_values, prop_mults = [read_json(file_name) for file_name in source_files]
+
+    dates = sorted({date for values in (card_values, prop_values, prop_mults) for v in values.values() for date in v})
+    quarter_index = {date: i for i, date in enumerate(dates)}
+    prop_names = sorted(set(prop_values.keys()) | set(prop_mults.keys()))
+
+    arrays = {
+        SCHEMA_VERSION_KEY: np.array(SNAPSHOT_SCHEMA_VERSION, dtype=np.int64),
+        SOURCE_DIGEST_KEY: np.array(get_source_digest(source_files)),
+        QUARTERS_KEY: np.array([datetime.datetime.strptime(d, DATE_FORMAT).toordinal() for d in dates], dtype=np.int64),
+        CARD_IDS_KEY: np.array([int(card_id) for card_id in card_values.keys()], dtype=np.int64),
+        CARD_VALUES_KEY: to_matrix(card_values, quarter_index),
+        PROP_NAMES_KEY: np.array(prop_names),
+        PROP_VALUES_KEY: to_matrix({name: prop_values.get(name, {}) for name in prop_names}, quarter_index),
+        PROP_MULTS_KEY: to_matrix({name: prop_mults.get(name, {}) for name in prop_names}, quarter_index),
+    }
+    arrays[CHECKSUM_KEY] = np.array(get_checksum(arrays))
+    # np.savez stores members uncompressed, which is what allows map_snapshot to memory map them
+    with open(snapshot_file, "wb") as out_file:
+        np.savez(out_file, **arrays)
+
+
+# memory maps every array of an uncompressed npz file without reading its contents
+def map_snapshot(snapshot_file: str) -> dict[str, np.ndarray]:
+    arrays = {}
+    with zipfile.ZipFile(snapshot_file) as archive, open(snapshot_file, "rb") as raw_file:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} in {snapshot_file} is compressed and cannot be memory mapped")
+            # the local header repeats the name and may carry a different extra field than the central directory
+            raw_file.seek(info.header_offset)
+            name_length, extra_length = struct.unpack("<HH", raw_file.read(ZIP_LOCAL_HEADER_SIZE)[26:30])
+            raw_file.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)
+
+            if np.lib.format.read_magic(raw_file) == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(raw_file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(raw_file)
+            key = info.filename.removesuffix(NPY_SUFFIX)
+            if not shape or 0 in shape:
+                arrays[key] = np.frombuffer(raw_file.read(dtype.itemsize * int(np.prod(shape))), dtype).reshape(shape)
+            else:
+                arrays[key] = np.memmap(raw_file, dtype, "r", raw_file.tell(), shape, "F" if fortran_order else "C")
+    return arrays
+
+
+# given a matrix of values over the quarters, returns the values keyed by row name then by date, latest date first
+def from_matrix(names: list[str], matrix: np.ndarray, quarters: list[datetime.date],
+                as_int: bool) -> dict[str, dict[datetime.date, int | float]]:
+    values = {}
+    # nan marks the quarters in which a row has no value, and is the only value not equal to itself
+    for name, row in zip(names, matrix.tolist()):
+        values[name] = {
+            quarters[i]: (int(row[i]) if as_int else row[i])
+            for i in range(len(quarters) - 1, -1, -1) if row[i] == row[i]
+        }
+    return values
+
+
+# loads a snapshot built by build_snapshot, returning the card values, prop values and prop mults in the format used by
+# main.View, or None if the snapshot is missing, corrupt, of another schema version or older than its source files
+def load_snapshot(
+        snapshot_file: str,
+        source_files: list[str]
+) -> tuple[dict[str, dict[datetime.date, int]], dict[str, dict[datetime.date, int]],
+           dict[str, dict[datetime.date, float]]] | None:
+    try:
+        arrays = map_snapshot(snapshot_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        print(f"ignoring unreadable snapshot {snapshot_file}: {e}")
+        return None
+
+    if SCHEMA_VERSION_KEY not in arrays or arrays[SCHEMA_VERSION_KEY].item() != SNAPSHOT_SCHEMA_VERSION:
+        print(f"ignoring snapshot {snapshot_file}: schema version does not match {SNAPSHOT_SCHEMA_VERSION}")
+        return None
+    if CHECKSUM_KEY not in arrays or arrays[CHECKSUM_KEY].item() != get_checksum(arrays):
+        print(f"ignoring snapshot {snapshot_file}: checksum does not match its contents")
+        return None
+    if arrays[SOURCE_DIGEST_KEY].item() != get_source_digest(source_files):
+        print(f"ignoring snapshot {snapshot_file}: it was not built from the current {', '.join(source_files)}")
+        return None
+
+    quarters = [datetime.date.fromordinal(ordinal) for ordinal in arrays[QUARTERS_KEY].tolist()]
+    card_ids = [str(card_id) for card_id in arrays[CARD_IDS_KEY].tolist()]
+    prop_names = arrays[PROP_NAMES_KEY].tolist()
+    return (
+        from_matrix(card_ids, arrays[CARD_VALUES_KEY], quarters, True),
+        from_matrix(prop_names, arrays[PROP_VALUES_KEY], quarters, True),
+        from_matrix(prop_names, arrays[PROP_MULTS_KEY], quarters, False),
+    )
+
+
+# builds the snapshot of the published data files, run from the repository root with `python -m etl.snapshot`
+if __name__ == '__main__':
+    build_snapshot("data/card_values.json", "data/prop_values.json", "data/prop_mults.json", "data/snapshot.npz")
@@ -0,0 +1,206 @@
+import numpy as np
+import scipy
+
+from etl.records import Trade
+
+# keys of the arrays which describe a list of trades, one entry per mint unless noted otherwise
+MINT_TRADE_KEY = "mint_trade"
+MINT_SIGN_KEY = "mint_sign"
+MINT_CARD_KEY = "mint_card"
+# one entry per (mint, prop) pair
+PROP_MINT_KEY = "prop_mint"
+PROP_INDEX_KEY = "prop_index"
+ARRAY_KEYS = (MINT_TRADE_KEY, MINT_SIGN_KEY, MINT_CARD_KEY, PROP_MINT_KEY, PROP_INDEX_KEY)
+
+
+# given a list of trades, returns arrays describing every mint in them along with the card ids and props they reference
+# estimates are laid out as in minimize_errors: card values, then prop values, then prop mults
+def encode_trades(trades: list[Trade]) -> tuple[dict[str, np.ndarray], list[int], list[int]]:
+    card_ids: dict[int, int] = {}
+    props: set[int] = set()
+    for trade in trades:
+        for party in (trade.offer, trade.request):
+            for mint in party:
+                card_ids.setdefault(mint.card, len(card_ids))
+                props.update(mint.props)
+    prop_ids = {prop: i for i, prop in enumerate(sorted(props))}
+
+    mint_trade, mint_sign, mint_card, prop_mint, prop_index = [], [], [], [], []
+    for i, trade in enumerate(trades):
+        for sign, party in ((1, trade.offer), (-1, trade.request)):
+            for mint in party:
+                for prop in mint.props:
+                    prop_mint.append(len(mint_trade))
+                    prop_index.append(prop_ids[prop])
+                mint_trade.append(i)
+                mint_sign.append(sign)
+                mint_card.append(card_ids[mint.card])
+
+    arrays = {
+        MINT_TRADE_KEY: np.array(mint_trade, dtype=np.int32),
+        MINT_SIGN_KEY: np.array(mint_sign, dtype=np.float64),
+        MINT_CARD_KEY: np.array(mint_card, dtype=np.int32),
+        PROP_MINT_KEY: np.array(prop_mint, dtype=np.int32),
+        PROP_INDEX_KEY: np.array(prop_index, dtype=np.int32),
+    }
+    return arrays, list(card_ids.keys()), list(prop_ids.keys())
+
+
+# given lists of weighted trades, returns the arrays describing all of them as one problem in which every list has its
+# own card and prop estimates, along with the (list position, card id) and (list position, prop) of every estimate
+# estimates are laid out as in encode_trades, so the functions below apply to the combined problem unchanged
+def encode_trade_lists(
+        trade_lists: list[list[Trade]]
+) -> tuple[dict[str, np.ndarray], list[tuple[int, int]], list[tuple[int, int]]]:
+    encoded = [encode_trades(trades) for trades in trade_lists]
+    card_keys = [(i, card_id) for i, (_, card_ids, _) in enumerate(encoded) for card_id in card_ids]
+    prop_keys = [(i, prop) for i, (_, _, props) in enumerate(encoded) for prop in props]
+
+    trade_offset = mint_offset = card_offset = prop_offset = 0
+    offset_arrays = {key: [] for key in ARRAY_KEYS}
+    for trades, (arrays, card_ids, props) in zip(trade_lists, encoded):
+        offset_arrays[MINT_TRADE_KEY].append(arrays[MINT_TRADE_KEY] + trade_offset)
+        offset_arrays[MINT_SIGN_KEY].append(arrays[MINT_SIGN_KEY])
+        offset_arrays[MINT_CARD_KEY].append(arrays[MINT_CARD_KEY] + card_offset)
+        offset_arrays[PROP_MINT_KEY].append(arrays[PROP_MINT_KEY] + mint_offset)
+        offset_arrays[PROP_INDEX_KEY].append(arrays[PROP_INDEX_KEY] + prop_offset)
+        trade_offset += len(trades)
+        mint_offset += len(arrays[MINT_CARD_KEY])
+        card_offset += len(card_ids)
+        prop_offset += len(props)
+
+    arrays = {
+        key: np.concatenate(parts) if parts else np.zeros(0, dtype=np.float64 if key == MINT_SIGN_KEY else np.int32)
+        for key, parts in offset_arrays.items()
+    }
+    return arrays, card_keys, prop_keys
+
+
+# given the estimates, returns the base value and multiplier of every mint
+def get_mint_values(
+        values: np.ndarray,
+        arrays: dict[str, np.ndarray],
+        card_count: int,
+        prop_count: int
+) -> tuple[np.ndarray, np.ndarray]:
+    mint_count = len(arrays[MINT_CARD_KEY])
+    prop_mint = arrays[PROP_MINT_KEY]
+    prop_index = arrays[PROP_INDEX_KEY]
+    prop_values = values[card_count:card_count + prop_count]
+    prop_mults = values[card_count + prop_count:]
+
+    base = values[arrays[MINT_CARD_KEY]] + np.bincount(prop_mint, prop_values[prop_index], mint_count)
+    mult = 1 + np.bincount(prop_mint, prop_mults[prop_index], mint_count)
+    return base, mult
+
+
+# given the estimates, returns the weighted sum of the square errors of all trades and its gradient
+def find_weighted_error(
+        values: np.ndarray,
+        arrays: dict[str, np.ndarray],
+        weights: np.ndarray,
+        card_count: int,
+        prop_count: int
+) -> tuple[float, np.ndarray]:
+    mint_trade = arrays[MINT_TRADE_KEY]
+    mint_sign = arrays[MINT_SIGN_KEY]
+    prop_mint = arrays[PROP_MINT_KEY]
+    prop_index = arrays[PROP_INDEX_KEY]
+    base, mult = get_mint_values(values, arrays, card_count, prop_count)
+
+    residuals = np.bincount(mint_trade, mint_sign * base * mult, len(weights))
+    error = float(np.dot(weights, residuals ** 2))
+
+    mint_gradient = 2 * (weights * residuals)[mint_trade] * mint_sign
+    gradient = np.concatenate((
+        np.bincount(arrays[MINT_CARD_KEY], mint_gradient * mult, card_count),
+        np.bincount(prop_index, (mint_gradient * mult)[prop_mint], prop_count),
+        np.bincount(prop_index, (mint_gradient * base)[prop_mint], prop_count),
+    ))
+    return error, gradient
+
+
+# given the estimates, returns the sparse jacobian of every trade's residual (offered minus requested value) with respect
+# to the estimates, one row per trade
+def get_residual_jacobian(
+        values: np.ndarray,
+        arrays: dict[str, np.ndarray],
+        trade_count: int,
+        card_count: int,
+        prop_count: int
+) -> scipy.sparse.csr_matrix:
+    mint_trade = arrays[MINT_TRADE_KEY]
+    mint_sign = arrays[MINT_SIGN_KEY]
+    prop_mint = arrays[PROP_MINT_KEY]
+    prop_index = arrays[PROP_INDEX_KEY]
+    base, mult = get_mint_values(values, arrays, card_count, prop_count)
+
+    prop_trade = mint_trade[prop_mint]
+    rows = np.concatenate((mint_trade, prop_trade, prop_trade))
+    columns = np.concatenate((arrays[MINT_CARD_KEY], card_count + prop_index, card_count + prop_count + prop_index))
+    entries = np.concatenate((mint_sign * mult, (mint_sign * mult)[prop_mint], (mint_sign * base)[prop_mint]))
+    # entries of a card or prop appearing on several mints of a trade are summed
+    return scipy.sparse.csr_matrix((entries, (rows, columns)), shape=(trade_count, card_count + 2 * prop_count))
+
+
+# returns a scale for every estimate which normalizes it by how heavily the trades constrain it
+# card and prop values are scaled by the weighted number of mints they appear on, prop mults by the weighted sum of the
+# squares of those mints' base values at start_values, so the error is roughly equally curved along every direction
+def get_parameter_scales(
+        arrays: dict[str, np.ndarray],
+        weights: np.ndarray,
+        start_values: np.ndarray,
+        card_count: int,
+        prop_count: int
+) -> np.ndarray:
+    mint_weights = weights[arrays[MINT_TRADE_KEY]]
+    prop_mint = arrays[PROP_MINT_KEY]
+    prop_index = arrays[PROP_INDEX_KEY]
+    base, _ = get_mint_values(start_values, arrays, card_count, prop_count)
+    curvature = np.concatenate((
+        np.bincount(arrays[MINT_CARD_KEY], mint_weights, card_count),
+        np.bincount(prop_index, mint_weights[prop_mint], prop_count),
+        np.bincount(prop_index, (mint_weights * base ** 2)[prop_mint], prop_count),
+    ))
+    return 1 / np.sqrt(np.maximum(curvature, 1))
+
+
+# returns the results of minimizing the weighted sum of the square errors, with the bounds used by minimize_errors
+# when scaled, the optimizer works on the estimates divided by get_parameter_scales, results are always in the
+# original units. The square of every entry of penalty multiplied by the estimates, less penalty_offsets, is added to
+# the error
+def minimize_weighted_errors(
+        arrays: dict[str, np.ndarray],
+        weights: np.ndarray,
+        start_values: np.ndarray,
+        card_count: int,
+        prop_count: int,
+        scaled: bool = False,
+        penalty: scipy.sparse.csr_matrix | None = None,
+        penalty_offsets: np.ndarray | None = None
+) -> scipy.optimize.OptimizeResult:
+    scales = get_parameter_scales(arrays, weights, start_values, card_count, prop_count) if scaled \
+        else np.ones(len(start_values))
+
+    def find_scaled_error(scaled_values: np.ndarray) -> tuple[float, np.ndarray]:
+        values = scaled_values * scales
+        error, gradient = find_weighted_error(values, arrays, weights, card_count, prop_count)
+        if penalty is not None:
+            penalties = penalty @ values
+            if penalty_offsets is not None:
+                penalties -= penalty_offsets
+            error += float(np.dot(penalties, penalties))
+            gradient += 2 * (penalty.T @ penalties)
+        return error, gradient * scales
+
+    lower_bounds = np.concatenate((np.ones(card_count), np.zeros(prop_count * 2)))
+    results = scipy.optimize.minimize(
+        find_scaled_error,
+        start_values / scales,
+        jac=True,
+        method="L-BFGS-B",
+        bounds=[(bound, None) for bound in lower_bounds / scales]
+    )
+    # a value stopped at bound / scale can land just under the bound once scaled back
+    results.x = np.maximum(results.x * scales, lower_bounds)
+    return results
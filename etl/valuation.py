@@ -0,0 +1,260 @@
+import datetime
+from typing import Any
+
+ITEMS_KEY = "items"
+OFFER_KEY = "offer"
+REQUEST_KEY = "request"
+CARDS_KEY = "cards"
+CARD_KEY = "card"
+CARD_ID_KEY = "cardId"
+OWNER_KEY = "owner"
+OWNER_ID_KEY = "owner_id"
+SEASON_KEY = "season"
+TRADE_COUNT_KEY = "tradeCount"
+ALTERNATES_KEY = "alternates"
+DIFFS_KEY = "diffs"
+ALTERNATES_COUNT_KEY = "alternatesCount"
+USER_KEY = "user"
+UPDATED_KEY = "updated_at"
+TRADE_ID_KEY = "id"
+DATE_FORMAT = "%Y-%m-%d"
+
+CASE_KEY = "case"
+CASE_GRADED_KEY = "graded"
+CASE_SLEEVE_KEY = "sleeve"
+CASE_CENTERPIECE_KEY = "centerpiece"
+RARITY_KEY = "rarity"
+RARITY_GREEN_KEY = "green"
+RARITY_GOLD_KEY = "gold"
+RARITY_RED_KEY = "red"
+RARITY_BLUE_KEY = "blue"
+RARITY_PURPLE_KEY = "purple"
+RARITY_SILVER_KEY = "silver"
+RARITY_PINK_KEY = "pink"
+RARITY_RAINBOW_KEY = "rainbow"
+RARITY_BLACK_KEY = "black"
+RARITY_FULLART_KEY = "fullart"
+RARITY_PROMO_KEY = "promo"
+RARITY_MONOCHROME_KEY = "monochrome"
+STAMPED_KEY = "stamped"
+STAMPED_GOLD_KEY = "gold"
+STAMPED_BLUE_KEY = "blue"
+STAMPED_RED_KEY = "red"
+REDEEMED_KEY = "redeemed"
+GRADE_OVERALL_KEY = "grade_overall"
+CARD_NUM_KEY = "cardnum"
+SERIES_MAX_KEY = "seriesmax"
+PROP_LIST_KEY = "prop_list"
+
+CASE_GRADED_INDEX = 0
+CASE_SLEEVE_INDEX = 1
+CASE_CENTERPIECE_INDEX = 2
+RARITY_GREEN_INDEX = 3
+RARITY_GOLD_INDEX = 4
+RARITY_RED_INDEX = 5
+RARITY_BLUE_INDEX = 6
+RARITY_PURPLE_INDEX = 7
+RARITY_SILVER_INDEX = 8
+RARITY_PINK_INDEX = 9
+RARITY_RAINBOW_INDEX = 10
+RARITY_BLACK_INDEX = 11
+RARITY_FULLART_INDEX = 12
+RARITY_PROMO_INDEX = 13
+RARITY_MONOCHROME_INDEX = 14
+STAMPED_GOLD_INDEX = 15
+STAMPED_BLUE_INDEX = 16
+STAMPED_RED_INDEX = 17
+UNREDEEMED_INDEX = 18
+GRADE_10_INDEX = 19
+GRADE_9_INDEX = 20
+GRADE_8_INDEX = 21
+GRADE_7_INDEX = 22
+GRADE_6_INDEX = 23
+GRADE_5_INDEX = 24
+CARD_NUM_MIN_INDEX = 25
+CARD_NUM_MAX_INDEX = 26
+
+PROP_INDEX_TO_NAME = {
+    CASE_GRADED_INDEX: "case_graded",
+    CASE_SLEEVE_INDEX: "case_sleeve",
+    CASE_CENTERPIECE_INDEX: "case_centerpiece",
+    RARITY_GREEN_INDEX: "rarity_green",
+    RARITY_GOLD_INDEX: "rarity_gold",
+    RARITY_RED_INDEX: "rarity_red",
+    RARITY_BLUE_INDEX: "rarity_blue",
+    RARITY_PURPLE_INDEX: "rarity_purple",
+    RARITY_SILVER_INDEX: "rarity_silver",
+    RARITY_PINK_INDEX: "rarity_pink",
+    RARITY_RAINBOW_INDEX: "rarity_rainbow",
+    RARITY_BLACK_INDEX: "rarity_black",
+    RARITY_FULLART_INDEX: "rarity_fullart",
+    RARITY_PROMO_INDEX: "rarity_promo",
+    RARITY_MONOCHROME_INDEX: "rarity_monochrome",
+    STAMPED_GOLD_INDEX: "stamped_gold",
+    STAMPED_BLUE_INDEX: "stamped_blue",
+    STAMPED_RED_INDEX: "stamped_red",
+    UNREDEEMED_INDEX: "unredeemed",
+    GRADE_10_INDEX: "grade_10",
+    GRADE_9_INDEX: "grade_9",
+    GRADE_8_INDEX: "grade_8",
+    GRADE_7_INDEX: "grade_7",
+    GRADE_6_INDEX: "grade_6",
+    GRADE_5_INDEX: "grade_5",
+    CARD_NUM_MIN_INDEX: "card_num_min",
+    CARD_NUM_MAX_INDEX: "card_num_max",
+}
+
+
+# converts a string representation of a timestamp into a datetime.date object
+def string_to_date(string: str) -> datetime.date:
+    return datetime.datetime.strptime(string.split("T")[0], DATE_FORMAT).date()
+
+
+# given a list of trades, returns a list of the trades where at least one card was exchanged for at least one card
+def filter_trades(trades: list[Any]) -> list[Any]:
+    filtered = []
+    for trade in trades:
+        valid = len(trade[OFFER_KEY][CARDS_KEY]) and len(trade[REQUEST_KEY][CARDS_KEY])
+        if valid:
+            filtered.append(trade)
+    return filtered
+
+
+# given a list of trades, returns the positions of the trades in which each card id was offered or requested, in trade
+# order. A card which appears more than once in a trade is indexed once for it
+def index_card_trades(trades: list[Any]) -> dict[int, list[int]]:
+    card_trades = {}
+    for position, trade in enumerate(trades):
+        card_ids = {card[CARD_KEY] for party in (trade[OFFER_KEY], trade[REQUEST_KEY]) for card in party[CARDS_KEY]}
+        for card_id in card_ids:
+            if card_id not in card_trades:
+                card_trades[card_id] = []
+            card_trades[card_id].append(position)
+    return card_trades
+
+
+# given a list of trades, returns the location of every mint with each prop, keyed by the name of the prop
+# a location is the position of the trade, the party (0 for the offer, 1 for the request) and the position in the party
+def index_prop_mints(trades: list[Any]) -> dict[str, list[tuple[int, int, int]]]:
+    prop_mints = {}
+    for position, trade in enumerate(trades):
+        for party_index, party in enumerate((trade[OFFER_KEY], trade[REQUEST_KEY])):
+            for card_index, card in enumerate(party[CARDS_KEY]):
+                for prop in load_card_props(card):
+                    name = PROP_INDEX_TO_NAME[prop]
+                    if name not in prop_mints:
+                        prop_mints[name] = []
+                    prop_mints[name].append((position, party_index, card_index))
+    return prop_mints
+
+
+# given card data, stores a list of all the card's properties on the card and returns the list
+def load_card_props(card: Any) -> list[int]:
+    if card.get(PROP_LIST_KEY):
+        return card[PROP_LIST_KEY]
+
+    props = []
+
+    case = card[CASE_KEY]
+    rarity = card[RARITY_KEY]
+    stamped = card[STAMPED_KEY]
+    redeemed = card[REDEEMED_KEY]
+    grade = card[GRADE_OVERALL_KEY]
+    card_num = card[CARD_NUM_KEY]
+    series_max = card[SERIES_MAX_KEY]
+
+    if case == CASE_GRADED_KEY:
+        props.append(CASE_GRADED_INDEX)
+    if case == CASE_SLEEVE_KEY:
+        props.append(CASE_SLEEVE_INDEX)
+    if case == CASE_CENTERPIECE_KEY:
+        props.append(CASE_CENTERPIECE_INDEX)
+
+    if rarity == RARITY_GREEN_KEY:
+        props.append(RARITY_GREEN_INDEX)
+    if rarity == RARITY_GOLD_KEY:
+        props.append(RARITY_GOLD_INDEX)
+    if rarity == RARITY_RED_KEY:
+        props.append(RARITY_RED_INDEX)
+    if rarity == RARITY_BLUE_KEY:
+        props.append(RARITY_BLUE_INDEX)
+    if rarity == RARITY_PURPLE_KEY:
+        props.append(RARITY_PURPLE_INDEX)
+    if rarity == RARITY_SILVER_KEY:
+        props.append(RARITY_SILVER_INDEX)
+    if rarity == RARITY_PINK_KEY:
+        props.append(RARITY_PINK_INDEX)
+    if rarity == RARITY_RAINBOW_KEY:
+        props.append(RARITY_RAINBOW_INDEX)
+    if rarity == RARITY_BLACK_KEY:
+        props.append(RARITY_BLACK_INDEX)
+    if rarity == RARITY_FULLART_KEY:
+        props.append(RARITY_FULLART_INDEX)
+    if rarity == RARITY_PROMO_KEY:
+        props.append(RARITY_PROMO_INDEX)
+    if rarity == RARITY_MONOCHROME_KEY:
+        props.append(RARITY_MONOCHROME_INDEX)
+
+    if stamped == STAMPED_GOLD_KEY:
+        props.append(STAMPED_GOLD_INDEX)
+    if stamped == STAMPED_BLUE_KEY:
+        props.append(STAMPED_BLUE_INDEX)
+    if stamped == STAMPED_RED_KEY:
+        props.append(STAMPED_RED_INDEX)
+
+    if redeemed is False:
+        props.append(UNREDEEMED_INDEX)
+
+    if grade:
+        if int(grade) == 10:
+            props.append(GRADE_10_INDEX)
+        if int(grade) == 9:
+            props.append(GRADE_9_INDEX)
+        if int(grade) == 8:
+            props.append(GRADE_8_INDEX)
+        if int(grade) == 7:
+            props.append(GRADE_7_INDEX)
+        if int(grade) == 6:
+            props.append(GRADE_6_INDEX)
+        if int(grade) == 5:
+            props.append(GRADE_5_INDEX)
+
+    if series_max > 1:
+        if card_num == 1:
+            props.append(CARD_NUM_MIN_INDEX)
+        if card_num == series_max:
+            props.append(CARD_NUM_MAX_INDEX)
+
+    card[PROP_LIST_KEY] = props
+    return props
+
+
+# given the estimates of card and property values, returns the value estimate of a mint (specific copy of a card)
+# mint is an etl.records.Mint
+def get_card_value(
+        values: list[float],
+        locations: dict[int, int],
+        prop_locations: dict[int, int],
+        mult_locations: dict[int, int],
+        mint: Any
+) -> float:
+    card_location = locations[mint.card]
+    prop_locs = [prop_locations[prop] for prop in mint.props]
+    mult_locs = [mult_locations[prop] for prop in mint.props]
+
+    basest_value = values[card_location]
+    prop_values = [values[loc] for loc in prop_locs]
+    prop_mults = [values[loc] for loc in mult_locs]
+
+    baser_value = basest_value + sum(prop_values)
+    mult_bonus = sum([mult * baser_value for mult in prop_mults])
+    return baser_value + mult_bonus
+
+
+# given a date and offset, returns the first day of the quarter in which the date (with offset) took place
+def get_period(date: datetime.date, offset: int = 0) -> datetime.date:
+    year = date.year
+    raw_month = date.month + offset
+    raw_month = raw_month if raw_month <= 12 else raw_month - 12
+    month = (raw_month - ((raw_month - 1) % 3))
+    return datetime.date(year, month, 1)
@@ -0,0 +1,45 @@
+import re
+import subprocess
+import sys
+
+# modules which the app only needs once a view is rendered, importing them at startup is a regression
+DEFERRED_MODULES = ("pandas", "numpy", "scipy", "millify")
+# time in microseconds which importing main may take on top of importing streamlit itself
+MAIN_BUDGET = 50000
+RUN_COUNT = 5
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)$")
+
+
+# imports main in a fresh interpreter and returns the cumulative import time of each top level module
+def get_import_times() -> dict[str, int]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            times[match.group(3)] = int(match.group(1))
+    return times
+
+
+# checks that importing main stays within budget and does not load deferred modules, returns the exit code
+def check_import_budget() -> int:
+    own_times = []
+    for _ in range(RUN_COUNT):
+        times = get_import_times()
+        loaded = [module for module in DEFERRED_MODULES if module in times]
+        if loaded:
+            print("main imports deferred modules at startup: " + ", ".join(loaded))
+            return 1
+        own_times.append(times["main"] - times.get("streamlit", 0))
+
+    # the fastest run is the least affected by noise from the rest of the system
+    own_time = min(own_times)
+    print(f"main import time excluding streamlit: {own_time / 1000:.1f} ms (budget {MAIN_BUDGET / 1000:.1f} ms)")
+    return 0 if own_time <= MAIN_BUDGET else 1
+
+
+if __name__ == '__main__':
+    sys.exit(check_import_budget())
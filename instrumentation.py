@@ -0,0 +1,149 @@
+import collections
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+# fraction of renders which are timed, set with the environment variable below
+SAMPLE_RATE_VARIABLE = "AMDP_TRACE_SAMPLE_RATE"
+DEFAULT_SAMPLE_RATE = 0.1
+# number of render durations kept per view for the latency percentiles
+LATENCY_WINDOW = 1000
+RECENT_SPAN_COUNT = 50
+
+TRACE_KEY = "trace"
+SPAN_KEY = "span"
+DURATION_KEY = "ms"
+ROWS_KEY = "rows"
+BYTES_KEY = "bytes"
+TOTAL_SPAN_NAME = "total"
+
+logger = logging.getLogger("appraise_my_dang_pack.render")
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+# returns the configured sample rate, invalid values disable sampling
+def get_sample_rate() -> float:
+    try:
+        return min(max(float(os.environ.get(SAMPLE_RATE_VARIABLE, DEFAULT_SAMPLE_RATE)), 0), 1)
+    except ValueError:
+        return 0
+
+
+# the Trace class collects the timing spans of one render of a view
+# forced traces are timed only because sampling was forced, they are left out of the latency percentiles
+class Trace:
+    def __init__(self, name: str, sampled: bool, forced: bool = False):
+        self.name = name
+        self.sampled = sampled
+        self.forced = forced
+        self.spans: list[dict[str, Any]] = []
+
+
+# the Stats class keeps render durations and recent spans across all sessions of the server process
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations: dict[str, collections.deque[float]] = {}
+        self.recent_spans: collections.deque[dict[str, Any]] = collections.deque(maxlen=RECENT_SPAN_COUNT)
+
+    # records the spans and total duration of a finished trace, the duration of a forced trace is not kept
+    def add(self, trace: Trace, duration: float):
+        with self.lock:
+            if not trace.forced:
+                if trace.name not in self.durations:
+                    self.durations[trace.name] = collections.deque(maxlen=LATENCY_WINDOW)
+                self.durations[trace.name].append(duration)
+            self.recent_spans.extend(trace.spans)
+
+    # returns the number of sampled renders and the p50 and p95 render durations in milliseconds of each view
+    def get_percentiles(self) -> dict[str, tuple[int, float, float]]:
+        with self.lock:
+            percentiles = {}
+            for name, durations in self.durations.items():
+                ordered = sorted(durations)
+                percentiles[name] = (
+                    len(ordered),
+                    ordered[int(0.5 * (len(ordered) - 1))],
+                    ordered[int(0.95 * (len(ordered) - 1))],
+                )
+            return percentiles
+
+    # returns the most recently recorded spans, latest last
+    def get_recent_spans(self) -> list[dict[str, Any]]:
+        with self.lock:
+            return list(self.recent_spans)
+
+
+stats = Stats()
+current_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("current_trace", default=None)
+
+
+# times the render of a view as a trace, the render is only timed for the sampled fraction of calls unless forced
+# a forced render still counts towards the percentiles when it would have been sampled anyway, so sessions which force
+# every render are weighted like any other
+@contextmanager
+def trace(name: str, force: bool = False) -> Iterator[Trace]:
+    sampled = random.random() < get_sample_rate()
+    active = Trace(name, sampled or force, force and not sampled)
+    token = current_trace.set(active)
+    start = time.perf_counter()
+    try:
+        yield active
+    finally:
+        current_trace.reset(token)
+        if active.sampled:
+            duration = (time.perf_counter() - start) * 1000
+            entry = {TRACE_KEY: name, SPAN_KEY: TOTAL_SPAN_NAME, DURATION_KEY: round(duration, 3)}
+            active.spans.append(entry)
+            stats.add(active, duration)
+            logger.info(json.dumps(entry))
+
+
+# times a stage of the current trace, the yielded dict can be filled with fields such as rows processed or bytes sent
+@contextmanager
+def span(name: str) -> Iterator[dict[str, Any]]:
+    active = current_trace.get()
+    fields: dict[str, Any] = {}
+    if active is None or not active.sampled:
+        yield fields
+        return
+
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        entry = {
+            TRACE_KEY: active.name,
+            SPAN_KEY: name,
+            DURATION_KEY: round((time.perf_counter() - start) * 1000, 3),
+            **fields,
+        }
+        active.spans.append(entry)
+        logger.info(json.dumps(entry, default=str))
+
+
+# returns whether the current trace is sampled, used to skip measurements that have a cost of their own
+def is_sampled() -> bool:
+    active = current_trace.get()
+    return active is not None and active.sampled
+
+
+# decorates a view's render method so every call is timed as a trace, force decides per call whether to always sample
+def traced(name: str, force: Callable[[], bool] = lambda: False) -> Callable:
+    def decorator(render: Callable) -> Callable:
+        @functools.wraps(render)
+        def wrapper(*args, **kwargs):
+            with trace(name, force()):
+                return render(*args, **kwargs)
+        return wrapper
+    return decorator
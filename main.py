@@ -1,14 +1,20 @@
+from __future__ import annotations
+
 import datetime
 import json
 import math
-from typing import Any
+import threading
+from typing import Any, TYPE_CHECKING
 
 from dateutil.relativedelta import relativedelta
 import streamlit as st
-import pandas as pd
-from millify import millify
 
-from etl.evaluate import filter_trades
+import instrumentation
+from etl.valuation import PROP_INDEX_TO_NAME, filter_trades, index_card_trades, index_prop_mints, load_card_props
+
+# pandas and millify are imported on first use to keep cold starts fast
+if TYPE_CHECKING:
+    import pandas as pd
 
 TEXT_KEY = "text"
 ITEMS_KEY = "items"
@@ -34,6 +40,8 @@ PROP_MULTS_FILE = "prop_mults.json"
 CARDS_FILE = "cards.json"
 TRADES_FILE = "trades.json"
 METHODOLOGY_FILE = "methodology.json"
+SNAPSHOT_FILE = "snapshot.npz"
+DATA_DIRECTORY = "data/"
 
 TITLE_HEADER = "Title"
 FLAVOR_HEADER = "Flavor"
@@ -47,10 +55,22 @@ OFFER_VALUE_HEADER = "Offer Value"
 REQUEST_VALUE_HEADER = "Request Value"
 DATE_HEADER = "Date"
 NET_OFFER_GAIN_HEADER = "Net Offer Gain"
+SIDE_HEADER = "Side"
+CARD_VALUE_HEADER = "Card Value"
 LINK_HEADER = "Link"
 
 BASE_URL = "https://dangpacks.com/"
 
+CARDS_VIEW_NAME = "Cards"
+TRADES_VIEW_NAME = "Trades"
+CARD_VIEW_NAME = "Card"
+COMPARE_VIEW_NAME = "Compare"
+METHODOLOGY_VIEW_NAME = "Methodology"
+VIEW_NAMES = [CARDS_VIEW_NAME, TRADES_VIEW_NAME, CARD_VIEW_NAME, COMPARE_VIEW_NAME, METHODOLOGY_VIEW_NAME]
+TRADES_PAGE_SIZE = 100
+LOAD_TRACE_NAME = "Load"
+DEBUG_QUERY_PARAM = "debug"
+
 RARITY_BLACK_NAME = "black"
 RARITY_BLACK_KEY = "rarity_black"
 RARITY_RAINBOW_NAME = "rainbow"
@@ -78,39 +98,98 @@ def string_to_date(string: str) -> datetime.date:
 
 # returns the json object located at the file with name file_name
 def get_data(file_name: str) -> Any:
-    with open("data/" + file_name, "r") as data_file:
+    with open(DATA_DIRECTORY + file_name, "r") as data_file:
         return json.load(data_file)
 
 
+# returns whether the render timings debug panel was requested with the ?debug=1 query parameter
+def is_debug() -> bool:
+    return st.query_params.get(DEBUG_QUERY_PARAM) == "1"
+
+
+# renders a dataframe, recording its rows, its serialized size and the time streamlit takes to send it
+def show_dataframe(df: pd.DataFrame, **kwargs):
+    if instrumentation.is_sampled():
+        from streamlit import dataframe_util
+        with instrumentation.span("serialize") as fields:
+            fields[instrumentation.ROWS_KEY] = len(df)
+            fields[instrumentation.BYTES_KEY] = len(dataframe_util.convert_pandas_df_to_arrow_bytes(df))
+    with instrumentation.span("send") as fields:
+        fields[instrumentation.ROWS_KEY] = len(df)
+        st.dataframe(df, **kwargs)
+
+
 # the View class contains methods to render all pages of the site
 class View:
     def __init__(self):
-        self.cards: dict[str, dict[str, Any]] = get_data(CARDS_FILE)
+        with instrumentation.span("load_cards") as fields:
+            self.cards: dict[str, dict[str, Any]] = get_data(CARDS_FILE)
+            fields[instrumentation.ROWS_KEY] = len(self.cards)
         self.card_values: dict[str, dict[datetime.date, int]] = {}
         self.prop_values: dict[str, dict[datetime.date, int]] = {}
         self.prop_mults: dict[str, dict[datetime.date, float]] = {}
-        self.trades: list[dict[str, Any]] = filter_trades(get_data(TRADES_FILE))
+        with instrumentation.span("load_trades") as fields:
+            self.trades: list[dict[str, Any]] = filter_trades(get_data(TRADES_FILE))
+            fields[instrumentation.ROWS_KEY] = len(self.trades)
+        # positions of the trades each card id took part in, so looking up a card only touches its own trades
+        with instrumentation.span("index_card_trades") as fields:
+            self.card_trades: dict[str, list[int]] = {
+                str(card_id): positions for card_id, positions in index_card_trades(self.trades).items()
+            }
+            fields[instrumentation.ROWS_KEY] = len(self.card_trades)
         self.methodology: str = get_data(METHODOLOGY_FILE)[TEXT_KEY]
         self.card_ids: list[str] = list(self.cards.keys())
         self.card_names: dict[str: int] = {self.get_card_full_name(card): card_id for card_id, card in
                                            self.cards.items()}
 
-        json_card_values = get_data(CARD_VALUES_FILE)
-        for key, value in json_card_values.items():
-            self.card_values[key] = {string_to_date(k): v for k, v in value.items()}
-
-        json_prop_values = get_data(PROP_VALUES_FILE)
-        for key, value in json_prop_values.items():
-            self.prop_values[key] = {string_to_date(k): v for k, v in value.items()}
-
-        json_prop_mults = get_data(PROP_MULTS_FILE)
-        for key, value in json_prop_mults.items():
-            self.prop_mults[key] = {string_to_date(k): v for k, v in value.items()}
+        # per view data, computed the first time its view is rendered
+        # the view is shared by every session, so each is built under the lock and only published once complete
+        self.lock = threading.Lock()
+        self.cards_frame: pd.DataFrame | None = None
+        self.trade_dates: list[datetime.date] = []
+        self.trade_offer_values: list[list[int]] = []
+        self.trade_request_values: list[list[int]] = []
+        self.trade_order: list[int] = []
+        self.trade_ranks: list[int] = []
+        self.prop_mints: dict[str, list[tuple[int, int, int]]] | None = None
+
+        with instrumentation.span("load_values") as fields:
+            self.load_values()
+            fields[instrumentation.ROWS_KEY] = len(self.card_values)
 
     # render cards table view
     @st.fragment
+    @instrumentation.traced(CARDS_VIEW_NAME, is_debug)
     def cards_view(self):
         st.subheader("Cards")
+        with instrumentation.span("build") as fields:
+            df = self.get_cards_frame()
+            fields[instrumentation.ROWS_KEY] = len(df)
+        show_dataframe(
+            df,
+            column_config={
+                TITLE_HEADER: st.column_config.TextColumn(TITLE_HEADER),
+                FLAVOR_HEADER: st.column_config.TextColumn(FLAVOR_HEADER),
+                SEASON_HEADER: st.column_config.NumberColumn(SEASON_HEADER),
+                CURRENT_VALUE_HEADER: st.column_config.NumberColumn(CURRENT_VALUE_HEADER, format="accounting"),
+                VALUE_TREND_HEADER: st.column_config.AreaChartColumn(VALUE_TREND_HEADER),
+                NUMBER_OF_TRADES_HEADER: st.column_config.NumberColumn(NUMBER_OF_TRADES_HEADER),
+                LINK_HEADER: st.column_config.LinkColumn(LINK_HEADER, display_text="link"),
+            },
+            hide_index=True
+        )
+
+    # returns the cards table, building it on first use
+    def get_cards_frame(self) -> pd.DataFrame:
+        if self.cards_frame is not None:
+            return self.cards_frame
+        with self.lock:
+            if self.cards_frame is None:
+                self.cards_frame = self.build_cards_frame()
+        return self.cards_frame
+
+    # returns the cards table, sorted by current value descending
+    def build_cards_frame(self) -> pd.DataFrame:
         data = {
             TITLE_HEADER: [],
             FLAVOR_HEADER: [],
@@ -131,26 +210,60 @@ class View:
             data[NUMBER_OF_TRADES_HEADER].append(card[TRADE_COUNT_KEY])
             data[LINK_HEADER].append(f"{BASE_URL}season/{card[SEASON_KEY]}/cards/{str(card[TITLE_KEY])}")
 
+        import pandas as pd
         df = pd.DataFrame(data)
-        df = df.sort_values(by=CURRENT_VALUE_HEADER, ascending=False)
-        st.dataframe(
+        return df.sort_values(by=CURRENT_VALUE_HEADER, ascending=False)
+
+    # render trades table view, only the filtered page of trades is built and sent to the browser
+    @st.fragment
+    @instrumentation.traced(TRADES_VIEW_NAME, is_debug)
+    def trades_view(self):
+        st.subheader("Trades")
+        with instrumentation.span("load_trade_rows") as fields:
+            self.load_trade_rows()
+            fields[instrumentation.ROWS_KEY] = len(self.trade_order)
+        if not self.trade_order:
+            st.caption("No trades")
+            return
+
+        first_date = min(self.trade_dates)
+        last_date = max(self.trade_dates)
+        date_section, card_section, rarity_section, value_section, page_section = st.columns([2, 3, 1, 1, 1])
+        date_range = date_section.date_input("Date Range", (first_date, last_date), min_value=first_date,
+                                             max_value=last_date)
+        card_name = card_section.selectbox("Card", sorted(self.card_names.keys()), index=None)
+        rarity = rarity_section.selectbox("Rarity", PROP_NAME_TO_KEY.keys(), index=None)
+        min_value = value_section.number_input("Minimum Value", min_value=0, value=0, step=1000)
+        start_date, end_date = date_range if len(date_range) == 2 else (first_date, last_date)
+        card_id = str(self.card_names[card_name]) if card_name else None
+
+        with instrumentation.span("filter") as fields:
+            positions = self.filter_trade_positions(start_date, end_date, card_id, PROP_NAME_TO_KEY.get(rarity),
+                                                    min_value)
+            fields[instrumentation.ROWS_KEY] = len(positions)
+        page_count = max(1, math.ceil(len(positions) / TRADES_PAGE_SIZE))
+        page = page_section.number_input("Page", min_value=1, max_value=page_count, value=1)
+        st.caption(f"{format(len(positions), ',')} trades, page {page} of {page_count}")
+
+        with instrumentation.span("build") as fields:
+            df = self.get_trades_frame(positions[(page - 1) * TRADES_PAGE_SIZE:page * TRADES_PAGE_SIZE])
+            fields[instrumentation.ROWS_KEY] = len(df)
+        show_dataframe(
             df,
             column_config={
-                TITLE_HEADER: st.column_config.TextColumn(TITLE_HEADER),
-                FLAVOR_HEADER: st.column_config.TextColumn(FLAVOR_HEADER),
-                SEASON_HEADER: st.column_config.NumberColumn(SEASON_HEADER),
-                CURRENT_VALUE_HEADER: st.column_config.NumberColumn(CURRENT_VALUE_HEADER, format="accounting"),
-                VALUE_TREND_HEADER: st.column_config.AreaChartColumn(VALUE_TREND_HEADER),
-                NUMBER_OF_TRADES_HEADER: st.column_config.NumberColumn(NUMBER_OF_TRADES_HEADER),
+                OFFER_HEADER: st.column_config.TextColumn(OFFER_HEADER),
+                REQUEST_HEADER: st.column_config.TextColumn(REQUEST_HEADER),
+                OFFER_VALUE_HEADER: st.column_config.NumberColumn(OFFER_VALUE_HEADER, format="accounting"),
+                REQUEST_VALUE_HEADER: st.column_config.NumberColumn(REQUEST_VALUE_HEADER, format="accounting"),
+                NET_OFFER_GAIN_HEADER: st.column_config.NumberColumn(NET_OFFER_GAIN_HEADER, format="accounting"),
+                DATE_HEADER: st.column_config.DateColumn(DATE_HEADER),
                 LINK_HEADER: st.column_config.LinkColumn(LINK_HEADER, display_text="link"),
             },
             hide_index=True
         )
 
-    # render trades table view
-    @st.fragment
-    def trades_view(self):
-        st.subheader("Trades")
+    # returns the trades table of the trades at the provided positions
+    def get_trades_frame(self, positions: list[int]) -> pd.DataFrame:
         data = {
             OFFER_HEADER: [],
             REQUEST_HEADER: [],
@@ -161,35 +274,134 @@ class View:
             LINK_HEADER: [],
         }
 
-        for trade in self.trades:
-            date = datetime.datetime.strptime(trade[UPDATED_KEY].split("T")[0], DATE_FORMAT).date()
-            offer_values = [self.get_card_value_from_date(card[CARD_ID_KEY], card[RARITY_KEY], date) for card in
-                            trade[OFFER_KEY][CARDS_KEY]]
-            request_values = [self.get_card_value_from_date(card[CARD_ID_KEY], card[RARITY_KEY], date) for card in
-                              trade[REQUEST_KEY][CARDS_KEY]]
+        for position in positions:
+            trade = self.trades[position]
+            offer_values = self.trade_offer_values[position]
+            request_values = self.trade_request_values[position]
             offer_value = sum(offer_values)
             request_value = sum(request_values)
-            data[OFFER_HEADER].append(
-                self.card_list_to_string(
-                    [card for card in trade[OFFER_KEY][CARDS_KEY]], offer_values
-                )
-            )
-            data[REQUEST_HEADER].append(
-                self.card_list_to_string(
-                    [card for card in trade[REQUEST_KEY][CARDS_KEY]], request_values
-                )
-            )
+            data[OFFER_HEADER].append(self.card_list_to_string(trade[OFFER_KEY][CARDS_KEY], offer_values))
+            data[REQUEST_HEADER].append(self.card_list_to_string(trade[REQUEST_KEY][CARDS_KEY], request_values))
             data[OFFER_VALUE_HEADER].append(offer_value)
             data[REQUEST_VALUE_HEADER].append(request_value)
             data[NET_OFFER_GAIN_HEADER].append(request_value - offer_value)
-            data[DATE_HEADER].append(date)
+            data[DATE_HEADER].append(self.trade_dates[position])
             data[LINK_HEADER].append(BASE_URL + "users/-/trades/" + str(trade[TRADE_ID_KEY]))
 
-        df = pd.DataFrame(data)
-        df = df.sort_values(by=OFFER_VALUE_HEADER, ascending=False)
-        st.dataframe(
+        import pandas as pd
+        return pd.DataFrame(data)
+
+    # computes the date and card values of every trade on first use, trades are ordered by offer value descending
+    def load_trade_rows(self):
+        if self.trade_order or not self.trades:
+            return
+        with self.lock:
+            if self.trade_order:
+                return
+
+            trade_dates = []
+            trade_offer_values = []
+            trade_request_values = []
+            for trade in self.trades:
+                date = string_to_date(trade[UPDATED_KEY])
+                trade_dates.append(date)
+                trade_offer_values.append([
+                    self.get_card_value_from_date(card[CARD_ID_KEY], card[RARITY_KEY], date)
+                    for card in trade[OFFER_KEY][CARDS_KEY]
+                ])
+                trade_request_values.append([
+                    self.get_card_value_from_date(card[CARD_ID_KEY], card[RARITY_KEY], date)
+                    for card in trade[REQUEST_KEY][CARDS_KEY]
+                ])
+
+            trade_order = sorted(range(len(self.trades)), key=lambda i: -sum(trade_offer_values[i]))
+            trade_ranks = [0] * len(self.trades)
+            for rank, position in enumerate(trade_order):
+                trade_ranks[position] = rank
+
+            self.trade_dates = trade_dates
+            self.trade_offer_values = trade_offer_values
+            self.trade_request_values = trade_request_values
+            self.trade_ranks = trade_ranks
+            # trade_order is checked to tell whether the rows are loaded, so it is published last
+            self.trade_order = trade_order
+
+    # returns the ordered positions of the trades within the date range, containing a mint of the card (if provided)
+    # with the prop (if provided), and with an offered or requested value of at least min_value
+    # only the indexed trades of the card, or else of the prop, are visited
+    def filter_trade_positions(self, start_date: datetime.date, end_date: datetime.date, card_id: str | None,
+                               prop_name: str | None, min_value: int) -> list[int]:
+        candidates = self.trade_order
+        if card_id is not None:
+            candidates = sorted(self.card_trades.get(card_id, []), key=self.trade_ranks.__getitem__)
+            if prop_name is not None:
+                candidates = [position for position in candidates if self.has_mint(position, card_id, prop_name)]
+        elif prop_name is not None:
+            candidates = sorted({location[0] for location in self.get_prop_mints().get(prop_name, [])},
+                                key=self.trade_ranks.__getitem__)
+
+        positions = []
+        for position in candidates:
+            if not start_date <= self.trade_dates[position] <= end_date:
+                continue
+            if max(sum(self.trade_offer_values[position]), sum(self.trade_request_values[position])) < min_value:
+                continue
+            positions.append(position)
+        return positions
+
+    # render the detail view of a single card: its value history and every trade it took part in with their valuations
+    @st.fragment
+    @instrumentation.traced(CARD_VIEW_NAME, is_debug)
+    def card_view(self):
+        st.subheader("Card")
+        card_section, rarity_section, page_section = st.columns([3, 1, 1])
+        card_name = card_section.selectbox("Card", sorted(self.card_names.keys()), index=None)
+        rarity = rarity_section.selectbox("Rarity", PROP_NAME_TO_KEY.keys(), index=None)
+        if not card_name:
+            st.caption("Select a card to see its value history and trades")
+            return
+        card_id = str(self.card_names[card_name])
+        prop_name = PROP_NAME_TO_KEY.get(rarity)
+
+        with instrumentation.span("load_trade_rows") as fields:
+            self.load_trade_rows()
+            fields[instrumentation.ROWS_KEY] = len(self.trade_order)
+        with instrumentation.span("lookup") as fields:
+            positions = sorted(self.card_trades.get(card_id, []), key=self.trade_dates.__getitem__, reverse=True)
+            if prop_name is not None:
+                positions = [position for position in positions if self.has_mint(position, card_id, prop_name)]
+            fields[instrumentation.ROWS_KEY] = len(positions)
+
+        import pandas as pd
+        history = self.pad_values(self.card_values[card_id])
+        dates = list(reversed(history.keys()))
+        value_section, count_section = st.columns(2)
+        value_section.metric(CURRENT_VALUE_HEADER, format(self.get_card_value_from_date(card_id, rarity), ","))
+        count_section.metric(NUMBER_OF_TRADES_HEADER, format(len(positions), ","))
+        st.line_chart(
+            pd.DataFrame({
+                DATE_HEADER: dates,
+                CARD_VALUE_HEADER: [self.get_card_value_from_date(card_id, rarity, date) for date in dates],
+            }),
+            x=DATE_HEADER,
+            y=CARD_VALUE_HEADER
+        )
+
+        page_count = max(1, math.ceil(len(positions) / TRADES_PAGE_SIZE))
+        page = page_section.number_input("Page", min_value=1, max_value=page_count, value=1)
+        with instrumentation.span("build") as fields:
+            page_positions = positions[(page - 1) * TRADES_PAGE_SIZE:page * TRADES_PAGE_SIZE]
+            df = self.get_trades_frame(page_positions)
+            sides, card_trade_values = zip(*[self.get_card_trade_value(position, card_id)
+                                             for position in page_positions]) if page_positions else ((), ())
+            df.insert(0, SIDE_HEADER, sides)
+            df.insert(1, CARD_VALUE_HEADER, card_trade_values)
+            fields[instrumentation.ROWS_KEY] = len(df)
+        show_dataframe(
             df,
             column_config={
+                SIDE_HEADER: st.column_config.TextColumn(SIDE_HEADER),
+                CARD_VALUE_HEADER: st.column_config.NumberColumn(CARD_VALUE_HEADER, format="accounting"),
                 OFFER_HEADER: st.column_config.TextColumn(OFFER_HEADER),
                 REQUEST_HEADER: st.column_config.TextColumn(REQUEST_HEADER),
                 OFFER_VALUE_HEADER: st.column_config.NumberColumn(OFFER_VALUE_HEADER, format="accounting"),
@@ -201,9 +413,47 @@ class View:
             hide_index=True
         )
 
+    # returns the side(s) of the trade at the provided position which the card was on, and the summed value of its
+    # mints in the trade
+    def get_card_trade_value(self, position: int, card_id: str) -> tuple[str, int]:
+        trade = self.trades[position]
+        sides = []
+        value = 0
+        for header, party, values in ((OFFER_HEADER, trade[OFFER_KEY], self.trade_offer_values[position]),
+                                      (REQUEST_HEADER, trade[REQUEST_KEY], self.trade_request_values[position])):
+            card_values = [v for card, v in zip(party[CARDS_KEY], values) if str(card[CARD_ID_KEY]) == card_id]
+            if card_values:
+                sides.append(header)
+                value += sum(card_values)
+        return " & ".join(sides), value
+
+    # returns the locations of the mints with each prop, indexing them on first use
+    def get_prop_mints(self) -> dict[str, list[tuple[int, int, int]]]:
+        if self.prop_mints is not None:
+            return self.prop_mints
+        with self.lock:
+            if self.prop_mints is None:
+                with instrumentation.span("index_prop_mints") as fields:
+                    prop_mints = index_prop_mints(self.trades)
+                    fields[instrumentation.ROWS_KEY] = len(prop_mints)
+                self.prop_mints = prop_mints
+        return self.prop_mints
+
+    # returns whether the trade at the provided position has a mint of the card with the prop
+    def has_mint(self, position: int, card_id: str, prop_name: str) -> bool:
+        trade = self.trades[position]
+        for party in (trade[OFFER_KEY], trade[REQUEST_KEY]):
+            for card in party[CARDS_KEY]:
+                if str(card[CARD_ID_KEY]) == card_id and \
+                        any(PROP_INDEX_TO_NAME[prop] == prop_name for prop in load_card_props(card)):
+                    return True
+        return False
+
     # render card comparison view
     @st.fragment
+    @instrumentation.traced(COMPARE_VIEW_NAME, is_debug)
     def compare_view(self):
+        from millify import millify
         st.subheader("Compare")
         compare_section = st.columns([4, 1, 4])[1].container()
         total_values = [0, 0]
@@ -234,11 +484,36 @@ class View:
 
     # render methodology page
     @st.fragment
+    @instrumentation.traced(METHODOLOGY_VIEW_NAME, is_debug)
     def methodology_view(self):
         st.subheader("Methodology")
         st.write("")
         st.text(self.methodology)
 
+    # loads the card values, prop values and prop mults from the binary snapshot when it matches the json data files,
+    # otherwise parses them from the json data files
+    def load_values(self):
+        from etl.snapshot import load_snapshot
+        snapshot = load_snapshot(
+            DATA_DIRECTORY + SNAPSHOT_FILE,
+            [DATA_DIRECTORY + file_name for file_name in (CARD_VALUES_FILE, PROP_VALUES_FILE, PROP_MULTS_FILE)]
+        )
+        if snapshot:
+            self.card_values, self.prop_values, self.prop_mults = snapshot
+            return
+
+        json_card_values = get_data(CARD_VALUES_FILE)
+        for key, value in json_card_values.items():
+            self.card_values[key] = {string_to_date(k): v for k, v in value.items()}
+
+        json_prop_values = get_data(PROP_VALUES_FILE)
+        for key, value in json_prop_values.items():
+            self.prop_values[key] = {string_to_date(k): v for k, v in value.items()}
+
+        json_prop_mults = get_data(PROP_MULTS_FILE)
+        for key, value in json_prop_mults.items():
+            self.prop_mults[key] = {string_to_date(k): v for k, v in value.items()}
+
     # given a dict mapping dates to values, returns a new dict with no gaps between the quarters (3 months)
     def pad_values(self, values: dict[datetime.date, int]) -> dict[datetime.date, int]:
         padded = {}
@@ -290,22 +565,50 @@ class View:
         return card[TITLE_KEY]
 
 
-# configures and renders the website
+# returns the view shared by all sessions, its data is loaded once per server process
+@st.cache_resource
+def get_view() -> View:
+    with instrumentation.trace(LOAD_TRACE_NAME, force=True):
+        return View()
+
+
+# renders the latency percentiles of each view and the most recent timing spans of this server process
+def debug_view():
+    import pandas as pd
+    with st.expander("Render Timings", expanded=True):
+        st.caption(f"sampling {instrumentation.get_sample_rate():.0%} of renders, the renders timed only because of "
+                   "debugging are left out of the percentiles but listed in the recent spans")
+        percentiles = instrumentation.stats.get_percentiles()
+        st.dataframe(
+            pd.DataFrame(
+                [(name, count, p50, p95) for name, (count, p50, p95) in percentiles.items()],
+                columns=["View", "Sampled Renders", "p50 (ms)", "p95 (ms)"]
+            ),
+            hide_index=True
+        )
+        st.dataframe(pd.DataFrame(reversed(instrumentation.stats.get_recent_spans())), hide_index=True)
+
+
+# configures and renders the website, only the selected view is built
 def render():
     title = "Appraise My DangPack V2"
     st.set_page_config(page_title=title, layout="wide")
     st.title(title)
     st.caption("*only contains cards which have been traded for other cards")
-    cards_tab, trades_tab, compare_tab, methodology_tab = st.tabs(["Cards", "Trades", "Compare", "Methodology"])
-    view = View()
-    with cards_tab as _:
-        view.cards_view()
-    with trades_tab as _:
+    view_name = st.radio("View", VIEW_NAMES, horizontal=True, label_visibility="collapsed", key="view")
+    view = get_view()
+    if view_name == TRADES_VIEW_NAME:
         view.trades_view()
-    with compare_tab as _:
+    elif view_name == CARD_VIEW_NAME:
+        view.card_view()
+    elif view_name == COMPARE_VIEW_NAME:
         view.compare_view()
-    with methodology_tab as _:
+    elif view_name == METHODOLOGY_VIEW_NAME:
         view.methodology_view()
+    else:
+        view.cards_view()
+    if is_debug():
+        debug_view()
 
 
 if __name__ == '__main__':